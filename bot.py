@@ -1,43 +1,381 @@
 import discord
+from discord import app_commands
 from discord.ext import commands
 from discord.ui import Button, View, Select, Modal, TextInput
 import os
 import json
+import sqlite3
+import struct
+import sys
 import random
+import difflib
 import secrets
-from datetime import datetime
+from datetime import datetime, timezone
 import asyncio
-from flask import Flask
-from threading import Thread
-
-# Keep bot alive
-app = Flask('')
-
-@app.route('/')
-def home():
-    return "<h1 style='text-align:center; margin-top:50px; font-family:Arial;'>Bot is Active</h1>"
-
-def run():
-    app.run(host='0.0.0.0', port=5000)
-
-def keep_alive():
-    t = Thread(target=run)
-    t.start()
+import time
+import math
+import functools
+import traceback
+import hashlib
+import gzip
+import html
+from aiohttp import web
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from array import array
+from dataclasses import dataclass, fields
+from bisect import bisect_left, insort
+from collections import deque, OrderedDict
+
+# Health server
+# Served from the bot's own event loop, so it reports on exactly what the bot sees
+HEALTH_HOST = '0.0.0.0'
+HEALTH_PORT = int(os.getenv('PORT', 5000))
+HEALTH_MAX_PERSIST_LAG = 60  # seconds of unwritten state before /healthz turns unhealthy
+health_runner = None
+
+async def home(request):
+    return web.Response(text="<h1 style='text-align:center; margin-top:50px; font-family:Arial;'>Bot is Active</h1>", content_type='text/html')
+
+def shard_states():
+    """Map of shard id -> (latency in seconds or None, connected)"""
+    if SHARDED:
+        return {
+            shard_id: (shard.latency if math.isfinite(shard.latency) else None, not shard.is_closed())
+            for shard_id, shard in bot.shards.items()
+        }
+    latency = bot.latency if math.isfinite(bot.latency) else None
+    return {bot.shard_id or 0: (latency, bot.ws is not None and not bot.is_closed())}
+
+def persistence_lag():
+    """Seconds the oldest unwritten record has been waiting"""
+    return time.monotonic() - _pending_since if _pending_since is not None else 0.0
+
+async def healthz(request):
+    shards = shard_states()
+    lag = persistence_lag()
+    healthy = bot.is_ready() and all(connected for _, connected in shards.values()) and lag < HEALTH_MAX_PERSIST_LAG
+    body = {
+        'status': 'ok' if healthy else 'unhealthy',
+        'ready': bot.is_ready(),
+        'latency_ms': round(bot.latency * 1000, 1) if math.isfinite(bot.latency) else None,
+        'shards': {
+            str(shard_id): {'latency_ms': round(latency * 1000, 1) if latency is not None else None, 'connected': connected}
+            for shard_id, (latency, connected) in shards.items()
+        },
+        'persistence': {
+            'backend': STORAGE_BACKEND,
+            'pending_records': len(_pending_records),
+            'lag_seconds': round(lag, 3),
+            'journal_seq': journal_seq,
+            'snapshot_seq': snapshot_seq,
+            'last_flush_seconds_ago': round(time.monotonic() - last_flush_at, 3) if last_flush_at else None,
+        },
+    }
+    return web.json_response(body, status=200 if healthy else 503)
+
+def metric_lines(name, kind, description, samples):
+    """Prometheus text exposition for one metric, samples are (labels, value) pairs"""
+    lines = [f'# HELP {name} {description}', f'# TYPE {name} {kind}']
+    for labels, value in samples:
+        label_text = ','.join(f'{key}="{value}"' for key, value in labels.items())
+        lines.append(f'{name}{{{label_text}}} {value}' if label_text else f'{name} {value}')
+    return lines
+
+def collect_gauges():
+    shards = shard_states()
+    return [
+        ('mmbot_ready', 'gauge', 'Whether the bot has finished connecting', [({}, int(bot.is_ready()))]),
+        ('mmbot_gateway_latency_seconds', 'gauge', 'Gateway heartbeat latency',
+         [({'shard': shard_id}, latency) for shard_id, (latency, _) in shards.items() if latency is not None]),
+        ('mmbot_shard_connected', 'gauge', 'Whether the shard has a live gateway connection',
+         [({'shard': shard_id}, int(connected)) for shard_id, (_, connected) in shards.items()]),
+        ('mmbot_guilds', 'gauge', 'Guilds the bot is in', [({}, len(bot.guilds))]),
+        ('mmbot_active_tickets', 'gauge', 'Open tickets', [({}, len(active_tickets))]),
+        ('mmbot_claimed_tickets', 'gauge', 'Claimed tickets', [({}, len(claimed_tickets))]),
+        ('mmbot_persist_pending_records', 'gauge', 'Records waiting for the storage backend', [({}, len(_pending_records))]),
+        ('mmbot_persist_lag_seconds', 'gauge', 'Age of the oldest unwritten record', [({}, persistence_lag())]),
+        ('mmbot_journal_seq', 'gauge', 'Sequence number of the last recorded mutation', [({}, journal_seq)]),
+        ('mmbot_coinflip_matches', 'gauge', 'Coinflip matches by state',
+         [({'state': 'running'}, cf_matches.running), ({'state': 'waiting'}, cf_matches.active - cf_matches.running)]),
+        ('mmbot_background_tasks', 'gauge', 'Background tasks in flight', [({}, len(_background_tasks))]),
+        ('mmbot_startup_seconds', 'gauge', 'Time-to-ready breakdown of the last startup',
+         [({'phase': phase}, seconds) for phase, seconds in startup_phases.items()]),
+        ('mmbot_pending_deletions', 'gauge', 'Closed ticket channels waiting to be deleted', [({}, len(pending_deletions))]),
+        ('mmbot_ticket_queue_depth', 'gauge', 'Tickets waiting for a creation worker',
+         [({}, sum(len(queue.jobs) for queue in ticket_queues.values()))]),
+    ]
+
+async def metrics(request):
+    lines = []
+    for gauge in collect_gauges():
+        lines += metric_lines(*gauge)
+    for metric in METRICS:
+        lines += metric.render()
+    return web.Response(text='\n'.join(lines) + '\n', content_type='text/plain', charset='utf-8', headers={'X-Content-Type-Options': 'nosniff'})
+
+async def start_health_server():
+    global health_runner
+    app = web.Application()
+    app.router.add_get('/', home)
+    app.router.add_get('/healthz', healthz)
+    app.router.add_get('/metrics', metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, HEALTH_HOST, HEALTH_PORT).start()
+    except OSError as e:
+        print(f'[ERROR] Health server could not listen on port {HEALTH_PORT}: {e}')
+        await runner.cleanup()
+        return
+    health_runner = runner
+    print(f'🩺 Health server listening on port {HEALTH_PORT}')
+
+# Metrics
+# Hot paths only bump in-memory counts; text is rendered when /metrics is scraped
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRICS = []
+
+class Counter:
+    """Monotonic count per label values"""
+    kind = 'counter'
+    
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.series = {}
+        METRICS.append(self)
+    
+    def inc(self, *values, amount=1):
+        self.series[values] = self.series.get(values, 0) + amount
+    
+    def render(self):
+        return metric_lines(self.name, self.kind, self.description, [
+            (dict(zip(self.labels, values)), count) for values, count in self.series.items()
+        ])
+
+class Histogram(Counter):
+    """Latency distribution per label values, the last label is always the outcome"""
+    kind = 'histogram'
+    
+    def __init__(self, name, description, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, description, labels + ('outcome',))
+        self.buckets = buckets
+    
+    def observe(self, values, seconds):
+        series = self.series.get(values)
+        if series is None:
+            # One slot per bucket plus +Inf, then the running sum
+            series = self.series[values] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, seconds)] += 1
+        series[-1] += seconds
+    
+    def time(self, *values):
+        return Timer(self, values)
+    
+    def render(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} {self.kind}']
+        for values, series in self.series.items():
+            labels = ','.join(f'{key}="{value}"' for key, value in zip(self.labels, values))
+            total = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series):
+                total += count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {total}')
+            lines.append(f'{self.name}_sum{{{labels}}} {series[-1]}')
+            lines.append(f'{self.name}_count{{{labels}}} {total}')
+        return lines
+
+class Timer:
+    """Context manager observing the time spent in its block"""
+    __slots__ = ('histogram', 'values', 'started')
+    
+    def __init__(self, histogram, values):
+        self.histogram = histogram
+        self.values = values
+    
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        outcome = 'ok' if exc_type is None else 'error'
+        self.histogram.observe(self.values + (outcome,), time.perf_counter() - self.started)
+
+def timed_callback(name):
+    """Time a view or modal callback under the given name"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with CALLBACK_SECONDS.time(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+COMMAND_SECONDS = Histogram('mmbot_command_seconds', 'Time spent handling a prefix or slash command', ('command',))
+CALLBACK_SECONDS = Histogram('mmbot_view_callback_seconds', 'Time spent in a view or modal callback', ('callback',))
+REST_SECONDS = Histogram('mmbot_rest_seconds', 'Discord REST calls made while opening tickets', ('call',))
+TICKET_QUEUE_SECONDS = Histogram('mmbot_ticket_queue_seconds', 'Time a ticket waited in its guild creation queue', ('kind',))
+TICKET_OPEN_SECONDS = Histogram('mmbot_ticket_open_seconds', 'Time from modal submit to a ready ticket channel', ('kind',))
+TICKETS_OPENED = Counter('mmbot_tickets_opened_total', 'Tickets opened by kind and channel source', ('kind', 'source'))
+TRANSCRIPT_SECONDS = Histogram('mmbot_transcript_seconds', 'Time to export and commit a ticket transcript')
+PERSIST_SECONDS = Histogram('mmbot_persist_seconds', 'Storage flush time by operation', ('operation',))
+MEMBER_LOOKUPS = Counter('mmbot_member_lookups_total', 'Member lookups by where the member was found', ('source',))
+PERSIST_RECORDS = Counter('mmbot_persist_records_total', 'Records handed to the storage backend')
 
 # Bot Configuration
 PREFIX = '$'
+# Every command is also a slash command. PREFIX_COMMANDS=0 turns the $ prefix
+# off so the bot can run without the message content intent; it then only
+# answers prefix commands that mention it.
+PREFIX_COMMANDS = os.getenv('PREFIX_COMMANDS', '1') != '0'
+APP_COMMANDS_HASH_FILE = 'app_commands.hash'
+# Defaults for every guild, $config overrides them per guild
 TICKET_CATEGORY = 'MM Tickets'
-PROOF_CHANNEL_ID = 1234567890  # CHANGE THIS TO YOUR PROOF CHANNEL ID
+PROOF_CHANNEL_ID = 1458163922262560840
+TRANSCRIPT_CHANNEL_ID = None  # where closed ticket transcripts are posted
 
 # Bot Setup
 intents = discord.Intents.default()
-intents.message_content = True
+intents.message_content = PREFIX_COMMANDS
 intents.members = True
-bot = commands.Bot(command_prefix=PREFIX, intents=intents, help_command=None)
+
+# Member cache
+# MEMBER_CACHE=lazy skips chunking at startup and keeps no member cache, which
+# on big guilds saves most of the bot's memory and the wait before on_ready.
+# The few members the bot needs are then fetched through a bounded LRU.
+LAZY_MEMBERS = os.getenv('MEMBER_CACHE', 'full') == 'lazy'
+MEMBER_LRU_SIZE = 5000
+MEMBER_LRU_TTL = 300
+member_options = {'chunk_guilds_at_startup': False, 'member_cache_flags': discord.MemberCacheFlags.none()} if LAZY_MEMBERS else {}
+
+# Sharding
+# AUTO_SHARD=1 runs as many shards as Discord recommends, all in this process.
+# SHARD_IDS ("0-3" or "0,2,5") with SHARD_COUNT runs a fixed set of shards, so a
+# deployment can be split over several processes. Those processes keep each
+# guild's state in its own partition under DATA_DIR instead of sharing files.
+def parse_shard_ids(text):
+    """Shard ids from "0-3,6" style text, None if unset"""
+    if not text:
+        return None
+    ids = []
+    for part in text.split(','):
+        first, _, last = part.strip().partition('-')
+        ids.extend(range(int(first), int(last or first) + 1))
+    return sorted(set(ids))
+
+AUTO_SHARD = os.getenv('AUTO_SHARD') == '1'
+SHARD_COUNT = int(os.getenv('SHARD_COUNT') or 0) or None
+SHARD_IDS = parse_shard_ids(os.getenv('SHARD_IDS'))
+SHARDED = AUTO_SHARD or SHARD_IDS is not None
+PARTITIONED = SHARD_IDS is not None
+DATA_DIR = 'data'
+
+def owns_guild(guild_id):
+    """Whether one of this process's shards serves the guild"""
+    return not PARTITIONED or (guild_id >> 22) % SHARD_COUNT in SHARD_IDS
+
+# Startup
+# start() begins loading state while the login request is in flight and
+# setup_hook waits for it, so state and persistent views are in place before
+# the gateway connects. on_ready fires again on every reconnect and only logs.
+startup_phases = {}  # phase -> seconds, reported once the bot is first ready
+_startup_started = 0.0
+_state_loader = None
+
+async def load_state():
+    """Split legacy files if needed, then load every store off the event loop"""
+    started = time.perf_counter()
+    if isinstance(storage, GuildPartitions):
+        await split_legacy_state()
+    await asyncio.get_running_loop().run_in_executor(_persist_executor, load_data)
+    startup_phases['state_load'] = time.perf_counter() - started
+
+def register_views():
+    """Persistent views, so panel and ticket buttons keep working across restarts"""
+    bot.add_view(TierSelectView())
+    bot.add_view(MMTicketView())
+    bot.add_view(SupportTicketView())
+    bot.add_view(MMSetupView())
+    bot.add_view(SupportSetupView())
+
+def report_startup():
+    # setup_hook runs inside login, the gateway connects right after it
+    total = time.perf_counter() - _startup_started
+    startup_phases['gateway'] = total - startup_phases.get('login', 0) - startup_phases.get('setup', 0)
+    startup_phases['ready'] = total
+    print(f'⏱️ Ready in {total:.2f}s (login {startup_phases.get("login", 0):.2f}s, '
+          f'state load {startup_phases.get("state_load", 0):.2f}s alongside login, '
+          f'setup {startup_phases.get("setup", 0):.2f}s, gateway {startup_phases["gateway"]:.2f}s)')
+
+class MMBot(commands.AutoShardedBot if SHARDED else commands.Bot):
+    async def start(self, token, *, reconnect=True):
+        global _startup_started, _state_loader
+        _startup_started = time.perf_counter()
+        _state_loader = asyncio.create_task(load_state())
+        await super().start(token, reconnect=reconnect)
+    
+    async def setup_hook(self):
+        global _persister
+        started = time.perf_counter()
+        startup_phases['login'] = started - _startup_started
+        await (_state_loader or load_state())
+        register_views()
+        _persister = asyncio.create_task(persistence_loop())
+        await start_health_server()
+        spawn(config_reload_loop(), 'Config reload')
+        spawn(sync_app_commands(), 'Slash command sync')
+        spawn(deletion_loop(), 'Channel deletion queue')
+        if TICKET_POOL_SIZE:
+            spawn(ticket_pool_loop(), 'Ticket pool')
+        startup_phases['setup'] = time.perf_counter() - started
+    
+    async def close(self):
+        # Guaranteed final flush, whatever the writer was doing
+        if _persister is not None:
+            _persister.cancel()
+        if _flush_task is not None and not _flush_task.done():
+            await asyncio.wait([_flush_task])
+        try:
+            await flush_persistence(compact=True)
+            await asyncio.get_running_loop().run_in_executor(_persist_executor, storage.close)
+        except Exception as e:
+            print(f'[ERROR] Final flush failed: {e}')
+        if health_runner is not None:
+            await health_runner.cleanup()
+        if _audit_executor is not None:
+            _audit_executor.shutdown(wait=False, cancel_futures=True)
+        await super().close()
+
+async def sync_app_commands():
+    """Push the slash command tree to Discord when it changed since the last sync"""
+    payload = json.dumps([command.to_dict(bot.tree) for command in bot.tree.get_commands()], sort_keys=True)
+    digest = hashlib.sha256(payload.encode()).hexdigest()
+    try:
+        with open(APP_COMMANDS_HASH_FILE) as f:
+            if f.read().strip() == digest:
+                return
+    except FileNotFoundError:
+        pass
+    synced = await bot.tree.sync()
+    with open(APP_COMMANDS_HASH_FILE, 'w') as f:
+        f.write(digest)
+    print(f'🔁 Synced {len(synced)} slash commands')
+
+shard_options = {'shard_ids': SHARD_IDS, 'shard_count': SHARD_COUNT} if SHARDED else {}
+bot = MMBot(
+    command_prefix=PREFIX if PREFIX_COMMANDS else commands.when_mentioned,
+    intents=intents,
+    help_command=None,
+    allowed_contexts=app_commands.AppCommandContext(guild=True),
+    **member_options,
+    **shard_options
+)
 
 # Storage
 active_tickets = {}
 claimed_tickets = {}
+pending_deletions = {}  # channel id -> Deletion, closed ticket channels not deleted yet
 mm_stats = {}
 
 # Color
@@ -75,7 +413,7 @@ MM_TIERS = {
     }
 }
 
-# MM Role IDs - UPDATE THESE WITH YOUR ROLE IDS
+# Default MM Role IDs - set per guild with $config
 MM_ROLE_IDS = {
     "basic": 1458128965351768064,        # 0-150M role ID
     "advanced": 1458129219862134794,     # 150-500M role ID
@@ -86,63 +424,1307 @@ MM_ROLE_IDS = {
 SUPPORT_CATEGORY = 'Support Tickets'
 STAFF_ROLE_ID = 1458152494923251833
 
-def save_data():
-    data = {
-        'active_tickets': active_tickets,
-        'claimed_tickets': claimed_tickets,
-        'mm_stats': mm_stats
+# State Model
+# Tickets are compact typed records keyed by int channel id: tiers are stored
+# as small int codes, timestamps as epoch seconds, and low-cardinality strings
+# are interned. Snapshots carry SCHEMA_VERSION; decode_state() migrates
+# anything older on load.
+SCHEMA_VERSION = 2
+TIER_CODES = {tier: code for code, tier in enumerate(MM_TIERS, 1)}
+TIER_KEYS = {code: tier for tier, code in TIER_CODES.items()}
+
+def to_epoch(value):
+    """Epoch seconds from an int or a naive UTC ISO timestamp, 0 if missing"""
+    if isinstance(value, int):
+        return value
+    try:
+        return int(datetime.fromisoformat(value).replace(tzinfo=timezone.utc).timestamp())
+    except (TypeError, ValueError):
+        return 0
+
+@dataclass(slots=True)
+class Ticket:
+    """An open MM or support ticket"""
+    user_id: int
+    created_at: int             # epoch seconds
+    type: str = 'mm'
+    tier: int = 0               # TIER_CODES value, 0 for support tickets
+    trader: str = None
+    giving: str = None
+    receiving: str = None
+    both_join: str = None
+    tip: str = None
+    reason: str = None
+    details: str = None
+    guild_id: int = None        # state partition, unknown for tickets opened before sharding
+    
+    def __post_init__(self):
+        # Shared by every ticket instead of one copy each
+        self.type = sys.intern(self.type)
+        if self.both_join is not None:
+            self.both_join = sys.intern(self.both_join)
+        if self.tip is not None:
+            self.tip = sys.intern(self.tip)
+    
+    @property
+    def tier_key(self):
+        return TIER_KEYS.get(self.tier)
+    
+    @property
+    def created_iso(self):
+        return datetime.fromtimestamp(self.created_at, timezone.utc).replace(tzinfo=None).isoformat()
+    
+    def to_dict(self):
+        """Persisted form, unset fields and defaults are left out"""
+        data = {}
+        for name in TICKET_FIELDS:
+            value = getattr(self, name)
+            if value is None or (name == 'type' and value == 'mm') or (name == 'tier' and not value):
+                continue
+            data[name] = value
+        return data
+    
+    @classmethod
+    def from_dict(cls, data):
+        data = {name: value for name, value in data.items() if name in TICKET_FIELDS}
+        # Schema 1 stored tier keys and ISO timestamps
+        if isinstance(data.get('tier'), str):
+            data['tier'] = TIER_CODES.get(data['tier'], 0)
+        if isinstance(data.get('created_at'), str):
+            data['created_at'] = to_epoch(data['created_at'])
+        return cls(**data)
+
+TICKET_FIELDS = tuple(f.name for f in fields(Ticket))
+
+@dataclass(slots=True)
+class Deletion:
+    """A closed ticket channel waiting for the deletion worker"""
+    guild_id: int
+    due_at: int                 # epoch seconds
+    
+    def to_dict(self):
+        return {'guild_id': self.guild_id, 'due_at': self.due_at}
+
+def encode_json(value):
+    """json.dump hook for the typed records"""
+    if isinstance(value, Ticket):
+        return value.to_dict()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+def encode_state(seq, tickets, claims, stats, deletions):
+    """Snapshot dict for the current schema"""
+    return {
+        'schema': SCHEMA_VERSION,
+        'seq': seq,
+        'active_tickets': {str(channel_id): ticket.to_dict() for channel_id, ticket in tickets.items()},
+        'claimed_tickets': {str(channel_id): user_id for channel_id, user_id in claims.items()},
+        'mm_stats': dict(stats),
+        'pending_deletions': {str(channel_id): deletion.to_dict() for channel_id, deletion in deletions.items()}
     }
-    with open('bot_data.json', 'w') as f:
-        json.dump(data, f, indent=4)
 
-def load_data():
-    global active_tickets, claimed_tickets
+def decode_state(data):
+    """Migrate a snapshot to SCHEMA_VERSION, return (seq, tickets, claims, stats, deletions)"""
+    version = data.get('schema', 0)
+    if version > SCHEMA_VERSION:
+        raise ValueError(f'snapshot schema {version} is newer than supported ({SCHEMA_VERSION})')
+    
+    # Schema 0 is the raw json.dump of the old dicts: same layout, no marker,
+    # and keys that came back as strings. Ticket.from_dict() upgrades the
+    # schema 0/1 ticket fields.
+    tickets = {int(channel_id): Ticket.from_dict(t) for channel_id, t in data.get('active_tickets', {}).items()}
+    claims = {int(channel_id): int(user_id) for channel_id, user_id in data.get('claimed_tickets', {}).items()}
+    stats = {str(user_id): int(n) for user_id, n in data.get('mm_stats', {}).items()}
+    # Snapshots from before the deletion queue simply have none pending
+    deletions = {int(channel_id): Deletion(**d) for channel_id, d in data.get('pending_deletions', {}).items()}
+    return data.get('seq', 0), tickets, claims, stats, deletions
+
+# Persistence
+# Every mutation is applied in memory and queued as one compact record. The
+# persistence task hands queued records to the storage backend from a worker
+# thread at most once per PERSIST_INTERVAL.
+STORAGE_BACKEND = 'json'  # 'json' (snapshot + journal) or 'sqlite'
+DATA_FILE = 'bot_data.json'
+JOURNAL_FILE = 'bot_data.journal'
+SQLITE_FILE = 'bot_data.db'
+PERSIST_INTERVAL = 1.0    # minimum seconds between two flushes
+COMPACT_EVERY = 1000      # journal records before a snapshot is forced
+COMPACT_INTERVAL = 300    # seconds between snapshots while records are pending
+COMPACT_CHECK = 30        # seconds the writer sleeps when nothing is dirty
+
+journal_seq = 0
+snapshot_seq = 0
+last_snapshot_at = 0.0
+last_flush_at = 0.0
+_pending_since = None  # monotonic time the oldest unwritten record was queued
+_pending_records = []
+_pending_proofs = []
+_dirty = asyncio.Event()
+_persister = None
+_flush_task = None  # flush started by the persistence loop, close() waits for it
+# One worker keeps writes, snapshots and queries strictly ordered
+_persist_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='persistence')
+guild_mm_stats = {}  # guild id -> the part of mm_stats earned there (partitioned layout only)
+SPLIT_LOCK_TIMEOUT = 600  # seconds before another process's split lock counts as abandoned
+
+def partition_file(guild_id, name):
+    """Path of a state file inside a guild's partition directory"""
+    directory = os.path.join(DATA_DIR, str(guild_id))
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, os.path.basename(name))
+
+def owned_partitions():
+    """Guild ids with a partition served by this process"""
+    if not os.path.isdir(DATA_DIR):
+        return []
+    return [int(name) for name in os.listdir(DATA_DIR) if name.isdigit() and owns_guild(int(name))]
+
+def add_guild_stat(guild_id, user_id):
+    stats = guild_mm_stats.setdefault(guild_id, {})
+    stats[user_id] = stats.get(user_id, 0) + 1
+
+def apply_record(record, track_stats=True):
+    """Apply a single mutation record to the in-memory state"""
+    op = record['op']
+    if op == 'open':
+        ticket = record['ticket']
+        active_tickets[record['channel_id']] = ticket if isinstance(ticket, Ticket) else Ticket.from_dict(ticket)
+    elif op == 'close':
+        active_tickets.pop(record['channel_id'], None)
+        claimed_tickets.pop(record['channel_id'], None)
+    elif op == 'claim':
+        claimed_tickets[record['channel_id']] = record['user_id']
+    elif op == 'unclaim':
+        claimed_tickets.pop(record['channel_id'], None)
+    elif op == 'delete_queued':
+        pending_deletions[record['channel_id']] = Deletion(record['guild_id'], record['due_at'])
+    elif op == 'deleted':
+        pending_deletions.pop(record['channel_id'], None)
+    elif op == 'proof' and track_stats:
+        completed = mm_stats.get(record['user_id'], 0)
+        mm_stats[record['user_id']] = completed + 1
+        mm_rank_index.update(int(record['user_id']), completed, completed + 1)
+
+class MMRankIndex:
+    """Middlemen kept sorted by completed tickets for O(log n) rank and O(K) pages"""
+    def __init__(self):
+        # (-completed, user_id) ascending == best first, ties by user id
+        self.keys = []
+    
+    def __len__(self):
+        return len(self.keys)
+    
+    def rebuild(self, stats):
+        self.keys = sorted((-n, int(uid)) for uid, n in stats.items())
+    
+    def update(self, user_id, old, new):
+        if old:
+            # Journal replay runs before rebuild(), so the old key may not be indexed yet
+            i = bisect_left(self.keys, (-old, user_id))
+            if i < len(self.keys) and self.keys[i] == (-old, user_id):
+                del self.keys[i]
+        insort(self.keys, (-new, user_id))
+    
+    def rank(self, completed):
+        """1 + number of middlemen with strictly more completed tickets"""
+        return bisect_left(self.keys, (-completed,)) + 1
+    
+    def page(self, limit, offset=0):
+        return [(uid, -neg) for neg, uid in self.keys[offset:offset + limit]]
+
+class JournalStore:
+    """bot_data.json snapshot plus an append-only journal, stats served from memory"""
+    in_memory = True
+    snapshots = True
+    
+    def __init__(self, data_file=DATA_FILE, journal_file=JOURNAL_FILE, guild_id=None):
+        self.data_file = data_file
+        self.journal_file = journal_file
+        self.guild_id = guild_id  # set for a guild partition
+        self._journal = None
+        self.stale = False  # snapshot is on an older schema and should be rewritten
+    
+    def load(self):
+        """Rebuild state from the snapshot plus the journal tail, return (last seq, snapshot seq)"""
+        seq = 0
+        try:
+            with open(self.data_file, 'r') as f:
+                data = json.load(f)
+            seq, tickets, claims, stats, deletions = decode_state(data)
+            active_tickets.update(tickets)
+            claimed_tickets.update(claims)
+            pending_deletions.update(deletions)
+            # Partitions each hold their guild's share of the stats
+            for user_id, completed in stats.items():
+                mm_stats[user_id] = mm_stats.get(user_id, 0) + completed
+            if self.guild_id is not None:
+                guild_mm_stats[self.guild_id] = dict(stats)
+            self.stale = data.get('schema', 0) < SCHEMA_VERSION
+            if self.guild_id is None:
+                print('✅ Data loaded successfully!')
+        except FileNotFoundError:
+            if self.guild_id is None:
+                print('⚠️ No saved data found, starting fresh.')
+        except Exception as e:
+            print(f'❌ Error loading data from {self.data_file}: {e}')
+        
+        snapshot_seq = seq
+        replayed = 0
+        try:
+            with open(self.journal_file, 'r') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Torn write at the tail, everything after it is lost anyway
+                        break
+                    if record['seq'] <= seq:
+                        continue
+                    apply_record(record)
+                    if self.guild_id is not None and record['op'] == 'proof':
+                        add_guild_stat(self.guild_id, record['user_id'])
+                    seq = record['seq']
+                    replayed += 1
+        except FileNotFoundError:
+            pass
+        
+        if replayed and self.guild_id is None:
+            print(f'✅ Replayed {replayed} journal records')
+        return seq, snapshot_seq
+    
+    def write(self, records):
+        """Append records to the journal in one write"""
+        if self._journal is None:
+            self._journal = open(self.journal_file, 'a')
+        self._journal.write(''.join(json.dumps(r, separators=(',', ':'), default=encode_json) + '\n' for r in records))
+        self._journal.flush()
+    
+    def snapshot(self, seq, tickets, claims, stats, deletions):
+        """Write a full snapshot and start a fresh journal"""
+        tmp_file = self.data_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(encode_state(seq, tickets, claims, stats, deletions), f, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.data_file)
+        
+        # Records up to seq are now in the snapshot
+        if self._journal is not None:
+            self._journal.close()
+        self._journal = open(self.journal_file, 'w')
+        self.stale = False
+    
+    def snapshot_stats(self):
+        """Consistent copy of the stats a snapshot needs, taken on the event loop"""
+        return dict(mm_stats)
+    
+    def close(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+    
+    def mm_summary(self, user_id):
+        """Return (completed, rank, total middlemen) for a user"""
+        completed = mm_stats.get(str(user_id))
+        if completed is None:
+            return 0, None, len(mm_rank_index)
+        return completed, mm_rank_index.rank(completed), len(mm_rank_index)
+    
+    def mm_leaderboard(self, limit, offset=0):
+        """Return ([(user_id, completed), ...], total middlemen) ordered by completed"""
+        return mm_rank_index.page(limit, offset), len(mm_rank_index)
+
+class GuildPartitions(JournalStore):
+    """One snapshot + journal per guild under DATA_DIR, for processes running a shard range"""
+    def __init__(self):
+        self.stores = {}
+        # Pre-sharding files: read for the stats they hold, never written again
+        self.legacy = JournalStore()
+    
+    @property
+    def stale(self):
+        return any(store.stale for store in self.stores.values())
+    
+    def store(self, guild_id):
+        store = self.stores.get(guild_id)
+        if store is None:
+            store = self.stores[guild_id] = JournalStore(
+                partition_file(guild_id, DATA_FILE), partition_file(guild_id, JOURNAL_FILE), guild_id
+            )
+        return store
+    
+    def load(self):
+        """Load the legacy stats and every partition this process serves"""
+        seq, snapshot_seq = self.legacy.load()
+        snapshot_seqs = []
+        for guild_id in owned_partitions():
+            last, snapshot = self.store(guild_id).load()
+            # New records must sort after everything already on disk
+            seq = max(seq, last, snapshot)
+            snapshot_seqs.append(snapshot)
+        print(f'✅ Loaded {len(self.stores)} guild partitions ({len(active_tickets)} open tickets)')
+        return seq, min(snapshot_seqs, default=snapshot_seq)
+    
+    def write(self, records):
+        by_guild = {}
+        for record in records:
+            by_guild.setdefault(record['guild_id'], []).append(record)
+        for guild_id, group in by_guild.items():
+            self.store(guild_id).write(group)
+    
+    def snapshot(self, seq, tickets, claims, stats, deletions):
+        """Snapshot every partition with its own slice of the state"""
+        by_guild = {guild_id: ({}, {}, {}) for guild_id in set(self.stores) | set(stats)}
+        orphans = 0
+        for channel_id, ticket in tickets.items():
+            if ticket.guild_id is None:
+                # No partition to write it to, it stays in memory until closed
+                orphans += 1
+                continue
+            by_guild.setdefault(ticket.guild_id, ({}, {}, {}))[0][channel_id] = ticket
+        for channel_id, user_id in claims.items():
+            ticket = tickets.get(channel_id)
+            if ticket is not None and ticket.guild_id is not None:
+                by_guild[ticket.guild_id][1][channel_id] = user_id
+        for channel_id, deletion in deletions.items():
+            by_guild.setdefault(deletion.guild_id, ({}, {}, {}))[2][channel_id] = deletion
+        
+        for guild_id, (guild_tickets, guild_claims, guild_deletions) in by_guild.items():
+            self.store(guild_id).snapshot(seq, guild_tickets, guild_claims, stats.get(guild_id, {}), guild_deletions)
+        if orphans:
+            print(f'[ERROR] Snapshot left out {orphans} tickets with no guild id')
+    
+    def snapshot_stats(self):
+        return {guild_id: dict(stats) for guild_id, stats in guild_mm_stats.items()}
+    
+    def close(self):
+        for store in self.stores.values():
+            store.close()
+
+async def split_legacy_state():
+    """Move open tickets and claims from the pre-sharding files into guild partitions"""
+    if not (os.path.exists(DATA_FILE) or os.path.exists(JOURNAL_FILE)):
+        return
+    
+    # Shard processes start together, exactly one of them does the split
+    os.makedirs(DATA_DIR, exist_ok=True)
+    lock = os.path.join(DATA_DIR, '.split.lock')
     try:
-        with open('bot_data.json', 'r') as f:
-            data = json.load(f)
-            active_tickets.update(data.get('active_tickets', {}))
-            claimed_tickets.update(data.get('claimed_tickets', {}))
-            mm_stats.update(data.get('mm_stats', {}))
-        print('✅ Data loaded successfully!')
-    except FileNotFoundError:
-        print('⚠️ No saved data found, starting fresh.')
-    except Exception as e:
-        print(f'❌ Error loading data: {e}')
+        if os.path.exists(lock) and time.time() - os.path.getmtime(lock) > SPLIT_LOCK_TIMEOUT:
+            os.remove(lock)
+        os.close(os.open(lock, os.O_CREAT | os.O_EXCL))
+    except FileExistsError:
+        while os.path.exists(lock):
+            await asyncio.sleep(1)
+        return
+    
+    try:
+        legacy = JournalStore()
+        seq, _ = legacy.load()
+        if not active_tickets and not claimed_tickets and not pending_deletions:
+            return
+        
+        # Tickets from before sharding don't know their guild, ask Discord
+        dropped = 0
+        for channel_id, ticket in list(active_tickets.items()):
+            if ticket.guild_id is None:
+                try:
+                    channel = bot.get_channel(channel_id) or await bot.fetch_channel(channel_id)
+                    ticket.guild_id = channel.guild.id
+                except (discord.NotFound, discord.Forbidden):
+                    del active_tickets[channel_id]
+                    dropped += 1
+        
+        partitions = GuildPartitions()
+        stats = {guild_id: {} for guild_id in {t.guild_id for t in active_tickets.values()}}
+        await asyncio.get_running_loop().run_in_executor(
+            _persist_executor, partitions.snapshot,
+            seq, dict(active_tickets), dict(claimed_tickets), stats, dict(pending_deletions)
+        )
+        partitions.close()
+        # What stays behind is stats only, which every process reads
+        legacy.snapshot(seq, {}, {}, dict(mm_stats), {})
+        legacy.close()
+        print(f'✅ Split {len(active_tickets)} tickets into {len(stats)} guild partitions ({dropped} with deleted channels dropped)')
+    finally:
+        active_tickets.clear()
+        claimed_tickets.clear()
+        pending_deletions.clear()
+        mm_stats.clear()
+        guild_mm_stats.clear()
+        os.remove(lock)
+
+SQLITE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tickets (
+    channel_id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    tier TEXT,
+    created_at TEXT,
+    closed_at TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_tickets_user ON tickets(user_id);
+CREATE INDEX IF NOT EXISTS idx_tickets_tier ON tickets(tier, created_at);
+CREATE INDEX IF NOT EXISTS idx_tickets_open ON tickets(channel_id) WHERE closed_at IS NULL;
+CREATE TABLE IF NOT EXISTS claims (
+    channel_id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    claimed_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_claims_user ON claims(user_id);
+CREATE TABLE IF NOT EXISTS proofs (
+    id INTEGER PRIMARY KEY,
+    mm_id INTEGER NOT NULL,
+    channel_id INTEGER,
+    tier TEXT,
+    completed_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_proofs_mm ON proofs(mm_id, completed_at);
+CREATE INDEX IF NOT EXISTS idx_proofs_tier ON proofs(tier, completed_at);
+CREATE INDEX IF NOT EXISTS idx_proofs_completed ON proofs(completed_at);
+CREATE TABLE IF NOT EXISTS mm_stats (
+    user_id INTEGER PRIMARY KEY,
+    completed INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_mm_stats_completed ON mm_stats(completed DESC);
+CREATE TABLE IF NOT EXISTS deletions (
+    channel_id INTEGER PRIMARY KEY,
+    guild_id INTEGER NOT NULL,
+    due_at INTEGER NOT NULL
+);
+'''
+
+class SqliteStore:
+    """SQLite (WAL) backend, MM stats are queried instead of held in memory"""
+    in_memory = False
+    snapshots = False
+    stale = False
+    
+    def __init__(self, path=SQLITE_FILE):
+        self.path = path
+        self.conn = None
+    
+    def connect(self):
+        if self.conn is None:
+            # Only ever used from the persistence thread
+            self.conn = sqlite3.connect(self.path, check_same_thread=False)
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('PRAGMA synchronous=NORMAL')
+            # Shard processes may share the database
+            self.conn.execute('PRAGMA busy_timeout=5000')
+            self.conn.executescript(SQLITE_SCHEMA)
+        return self.conn
+    
+    def load(self):
+        """Load open tickets and claims, migrating bot_data.json on first run"""
+        conn = self.connect()
+        migrated = conn.execute("SELECT value FROM meta WHERE key = 'migrated_json'").fetchone()
+        if not migrated and (os.path.exists(DATA_FILE) or os.path.exists(JOURNAL_FILE)):
+            self.migrate_json()
+        
+        for channel_id, data in conn.execute('SELECT channel_id, data FROM tickets WHERE closed_at IS NULL'):
+            ticket = Ticket.from_dict(json.loads(data))
+            if ticket.guild_id is None or owns_guild(ticket.guild_id):
+                active_tickets[channel_id] = ticket
+        for channel_id, user_id in conn.execute('SELECT channel_id, user_id FROM claims'):
+            if channel_id in active_tickets:
+                claimed_tickets[channel_id] = user_id
+        for channel_id, guild_id, due_at in conn.execute('SELECT channel_id, guild_id, due_at FROM deletions'):
+            if owns_guild(guild_id):
+                pending_deletions[channel_id] = Deletion(guild_id, due_at)
+        print(f'✅ Data loaded successfully! ({len(active_tickets)} open tickets)')
+        return 0, 0
+    
+    def migrate_json(self):
+        """One-shot import of bot_data.json and its journal into the database"""
+        JournalStore().load()
+        conn = self.conn
+        with conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO tickets (channel_id, user_id, tier, created_at, data) VALUES (?, ?, ?, ?, ?)',
+                [(cid, t.user_id, t.tier_key, t.created_iso, json.dumps(t.to_dict())) for cid, t in active_tickets.items()]
+            )
+            conn.executemany(
+                'INSERT OR REPLACE INTO claims (channel_id, user_id) VALUES (?, ?)',
+                list(claimed_tickets.items())
+            )
+            conn.executemany(
+                'INSERT OR REPLACE INTO mm_stats (user_id, completed) VALUES (?, ?)',
+                [(int(uid), n) for uid, n in mm_stats.items()]
+            )
+            conn.executemany(
+                'INSERT OR REPLACE INTO deletions (channel_id, guild_id, due_at) VALUES (?, ?, ?)',
+                [(cid, d.guild_id, d.due_at) for cid, d in pending_deletions.items()]
+            )
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_json', ?)", (datetime.utcnow().isoformat(),))
+        print(f'✅ Migrated {len(active_tickets)} tickets and {len(mm_stats)} middlemen from {DATA_FILE}')
+        active_tickets.clear()
+        claimed_tickets.clear()
+        pending_deletions.clear()
+        mm_stats.clear()
+    
+    def write(self, records):
+        """Apply records in a single transaction"""
+        conn = self.connect()
+        with conn:
+            for r in records:
+                op = r['op']
+                if op == 'open':
+                    t = r['ticket']
+                    conn.execute(
+                        'INSERT OR REPLACE INTO tickets (channel_id, user_id, tier, created_at, data) VALUES (?, ?, ?, ?, ?)',
+                        (r['channel_id'], t.user_id, t.tier_key, t.created_iso, json.dumps(t.to_dict()))
+                    )
+                elif op == 'close':
+                    conn.execute('UPDATE tickets SET closed_at = ? WHERE channel_id = ?', (r['at'], r['channel_id']))
+                    conn.execute('DELETE FROM claims WHERE channel_id = ?', (r['channel_id'],))
+                elif op == 'claim':
+                    conn.execute(
+                        'INSERT OR REPLACE INTO claims (channel_id, user_id, claimed_at) VALUES (?, ?, ?)',
+                        (r['channel_id'], r['user_id'], r['at'])
+                    )
+                elif op == 'unclaim':
+                    conn.execute('DELETE FROM claims WHERE channel_id = ?', (r['channel_id'],))
+                elif op == 'delete_queued':
+                    conn.execute(
+                        'INSERT OR REPLACE INTO deletions (channel_id, guild_id, due_at) VALUES (?, ?, ?)',
+                        (r['channel_id'], r['guild_id'], r['due_at'])
+                    )
+                elif op == 'deleted':
+                    conn.execute('DELETE FROM deletions WHERE channel_id = ?', (r['channel_id'],))
+                elif op == 'proof':
+                    mm_id = int(r['user_id'])
+                    conn.execute(
+                        'INSERT INTO proofs (mm_id, channel_id, tier, completed_at) VALUES (?, ?, ?, ?)',
+                        (mm_id, r.get('channel_id'), r.get('tier'), r['at'])
+                    )
+                    conn.execute(
+                        'INSERT INTO mm_stats (user_id, completed) VALUES (?, 1) '
+                        'ON CONFLICT(user_id) DO UPDATE SET completed = completed + 1',
+                        (mm_id,)
+                    )
+    
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+    
+    def mm_summary(self, user_id):
+        """Return (completed, rank, total middlemen) for a user"""
+        conn = self.connect()
+        total = conn.execute('SELECT COUNT(*) FROM mm_stats').fetchone()[0]
+        row = conn.execute('SELECT completed FROM mm_stats WHERE user_id = ?', (user_id,)).fetchone()
+        if not row:
+            return 0, None, total
+        ahead = conn.execute('SELECT COUNT(*) FROM mm_stats WHERE completed > ?', (row[0],)).fetchone()[0]
+        return row[0], ahead + 1, total
+    
+    def mm_leaderboard(self, limit, offset=0):
+        """Return ([(user_id, completed), ...], total middlemen) ordered by completed"""
+        conn = self.connect()
+        rows = conn.execute(
+            'SELECT user_id, completed FROM mm_stats ORDER BY completed DESC, user_id LIMIT ? OFFSET ?',
+            (limit, offset)
+        ).fetchall()
+        total = conn.execute('SELECT COUNT(*) FROM mm_stats').fetchone()[0]
+        return rows, total
+
+# Proof history
+# Each $proof is appended to PROOF_HISTORY_FILE as part of a columnar segment
+# (one array per field), written once per flush. Only the rolling aggregates
+# live in memory, so stats queries never scan the history.
+PROOF_HISTORY_FILE = 'proof_history.bin'
+# Open -> proof times go in log-linear buckets: exact below 8s, then 8 equal
+# sub-buckets per power of two, so a bucket spans at most 1/8 of its value
+DURATION_SUB_BITS = 3
+DURATION_SUB_BUCKETS = 1 << DURATION_SUB_BITS
+DURATION_BUCKETS = DURATION_SUB_BUCKETS * 34  # up to 2^34 seconds
+
+def duration_bucket(seconds):
+    """Histogram bucket holding a duration in seconds"""
+    if seconds < DURATION_SUB_BUCKETS:
+        return seconds
+    shift = seconds.bit_length() - 1 - DURATION_SUB_BITS
+    bucket = ((shift + 1) << DURATION_SUB_BITS) + ((seconds >> shift) & (DURATION_SUB_BUCKETS - 1))
+    return min(bucket, DURATION_BUCKETS - 1)
+
+def duration_bucket_bounds(bucket):
+    """[lower, upper) seconds covered by a bucket"""
+    if bucket < DURATION_SUB_BUCKETS:
+        return bucket, bucket + 1
+    shift = (bucket >> DURATION_SUB_BITS) - 1
+    lower = (DURATION_SUB_BUCKETS | (bucket & (DURATION_SUB_BUCKETS - 1))) << shift
+    return lower, lower + (1 << shift)
+
+_SEGMENT_HEADER = struct.Struct('<4sI')
+_SEGMENT_MAGIC = b'PRF1'
+
+class ProofHistory:
+    """Append-only columnar log of completed trades plus incremental aggregates"""
+    # Fixed-width columns, followed in each segment by trader string lengths and bytes
+    COLUMNS = (
+        ('mm_id', 'q'),
+        ('requester_id', 'q'),
+        ('tier', 'B'),
+        ('created_at', 'q'),
+        ('completed_at', 'q')
+    )
+    
+    def __init__(self, path=PROOF_HISTORY_FILE):
+        self.path = path
+        self.reset()
+    
+    def reset(self):
+        self.total = 0
+        self.by_tier = {}         # tier code -> trades
+        self.by_day_tier = {}     # (epoch day, tier code) -> trades
+        self.by_mm_tier = {}      # (mm id, tier code) -> trades
+        self.durations = {}       # tier code -> trades per duration_bucket()
+    
+    def add(self, mm_id, tier, created_at, completed_at):
+        """Fold one trade into the aggregates"""
+        self.total += 1
+        self.by_tier[tier] = self.by_tier.get(tier, 0) + 1
+        key = (completed_at // 86400, tier)
+        self.by_day_tier[key] = self.by_day_tier.get(key, 0) + 1
+        key = (mm_id, tier)
+        self.by_mm_tier[key] = self.by_mm_tier.get(key, 0) + 1
+        
+        if created_at and completed_at >= created_at:
+            bucket = duration_bucket(completed_at - created_at)
+            hist = self.durations.get(tier)
+            if hist is None:
+                hist = self.durations[tier] = [0] * DURATION_BUCKETS
+            hist[bucket] += 1
+    
+    def add_record(self, record):
+        self.add(
+            int(record['user_id']),
+            TIER_CODES.get(record.get('tier'), 0),
+            to_epoch(record.get('created_at')),
+            to_epoch(record['at'])
+        )
+    
+    def files(self):
+        """Segment files holding this process's history"""
+        if not PARTITIONED:
+            return [self.path]
+        # The pre-sharding file is only read, new segments go to the guild partitions
+        return [self.path] + [partition_file(guild_id, self.path) for guild_id in owned_partitions()]
+    
+    def load(self):
+        """Rebuild the aggregates from every segment file"""
+        self.reset()
+        for path in self.files():
+            self.load_file(path)
+    
+    def load_file(self, path):
+        """Stream the fixed-width columns of every segment in one file"""
+        try:
+            f = open(path, 'r+b')
+        except FileNotFoundError:
+            return
+        
+        with f:
+            good_end = 0
+            while True:
+                header = f.read(_SEGMENT_HEADER.size)
+                if len(header) < _SEGMENT_HEADER.size:
+                    break
+                magic, count = _SEGMENT_HEADER.unpack(header)
+                if magic != _SEGMENT_MAGIC:
+                    break
+                try:
+                    columns = {}
+                    for name, typecode in self.COLUMNS:
+                        columns[name] = self._read_array(f, typecode, count)
+                    lengths = self._read_array(f, 'I', count)
+                except EOFError:
+                    break
+                blob_size = sum(lengths)
+                f.seek(blob_size, os.SEEK_CUR)
+                if f.tell() > os.fstat(f.fileno()).st_size:
+                    break
+                
+                for mm_id, tier, created_at, completed_at in zip(
+                    columns['mm_id'], columns['tier'], columns['created_at'], columns['completed_at']
+                ):
+                    self.add(mm_id, tier, created_at, completed_at)
+                good_end = f.tell()
+            
+            # Drop a segment torn by a crash so later appends stay aligned
+            f.truncate(good_end)
+    
+    @staticmethod
+    def _read_array(f, typecode, count):
+        arr = array(typecode)
+        data = f.read(arr.itemsize * count)
+        if len(data) < arr.itemsize * count:
+            raise EOFError
+        arr.frombytes(data)
+        if sys.byteorder == 'big':
+            arr.byteswap()
+        return arr
+    
+    def write(self, records):
+        """Append a batch of proof records (runs in the persistence thread)"""
+        if not PARTITIONED:
+            return self.write_segment(self.path, records)
+        by_guild = {}
+        for record in records:
+            by_guild.setdefault(record['guild_id'], []).append(record)
+        for guild_id, group in by_guild.items():
+            self.write_segment(partition_file(guild_id, self.path), group)
+    
+    def write_segment(self, path, records):
+        """Append one segment holding a batch of proof records"""
+        columns = {name: array(typecode) for name, typecode in self.COLUMNS}
+        lengths = array('I')
+        traders = []
+        for r in records:
+            columns['mm_id'].append(int(r['user_id']))
+            columns['requester_id'].append(r.get('requester_id') or 0)
+            columns['tier'].append(TIER_CODES.get(r.get('tier'), 0))
+            columns['created_at'].append(to_epoch(r.get('created_at')))
+            columns['completed_at'].append(to_epoch(r['at']))
+            trader = (r.get('trader') or '').encode('utf-8')
+            lengths.append(len(trader))
+            traders.append(trader)
+        
+        chunks = [_SEGMENT_HEADER.pack(_SEGMENT_MAGIC, len(records))]
+        for arr in list(columns.values()) + [lengths]:
+            if sys.byteorder == 'big':
+                arr.byteswap()
+            chunks.append(arr.tobytes())
+        chunks.extend(traders)
+        with open(path, 'ab') as f:
+            f.write(b''.join(chunks))
+    
+    def trades_since(self, days, tier=None):
+        """Trades completed in the last `days` calendar days (UTC), optionally for one tier"""
+        today = int(time.time()) // 86400
+        tiers = [TIER_CODES[tier]] if tier else list(TIER_KEYS)
+        return sum(self.by_day_tier.get((day, code), 0) for day in range(today - days + 1, today + 1) for code in tiers)
+    
+    def mm_tiers(self, mm_id):
+        """Trades completed by one middleman, per tier key"""
+        return {tier: self.by_mm_tier.get((mm_id, code), 0) for tier, code in TIER_CODES.items()}
+    
+    def median_duration(self, tier=None):
+        """Approximate median seconds from ticket open to proof, None without data"""
+        tiers = [TIER_CODES[tier]] if tier else list(self.durations)
+        hist = [0] * DURATION_BUCKETS
+        for code in tiers:
+            for bucket, n in enumerate(self.durations.get(code, ())):
+                hist[bucket] += n
+        
+        total = sum(hist)
+        if not total:
+            return None
+        seen = 0
+        for bucket, n in enumerate(hist):
+            if (seen + n) * 2 >= total:
+                # Interpolate linearly inside the bucket holding the middle trade
+                lower, upper = duration_bucket_bounds(bucket)
+                return int(lower + (upper - lower) * (total / 2 - seen) / n)
+            seen += n
+
+mm_rank_index = MMRankIndex()
+if STORAGE_BACKEND == 'sqlite':
+    storage = SqliteStore()
+elif PARTITIONED:
+    storage = GuildPartitions()
+else:
+    storage = JournalStore()
+proof_history = ProofHistory()
+
+def record_mutation(op, **fields):
+    """Apply a mutation to memory and queue it for the storage backend"""
+    global journal_seq, _pending_since
+    journal_seq += 1
+    record = {'seq': journal_seq, 'op': op, 'at': datetime.utcnow().isoformat(), **fields}
+    apply_record(record, storage.in_memory)
+    if _pending_since is None:
+        _pending_since = time.monotonic()
+    _pending_records.append(record)
+    if op == 'proof':
+        proof_history.add_record(record)
+        _pending_proofs.append(record)
+        if PARTITIONED:
+            add_guild_stat(record['guild_id'], record['user_id'])
+    _dirty.set()
+
+async def flush_persistence(compact=False):
+    """Write queued records, folding them into a snapshot when compaction is due"""
+    global snapshot_seq, last_snapshot_at, last_flush_at, _pending_since
+    records = _pending_records[:]
+    _pending_records.clear()
+    proofs = _pending_proofs[:]
+    _pending_proofs.clear()
+    since, _pending_since = _pending_since, None
+    _dirty.clear()
+    
+    pending = journal_seq - snapshot_seq
+    due = pending >= COMPACT_EVERY or time.monotonic() - last_snapshot_at >= COMPACT_INTERVAL
+    loop = asyncio.get_running_loop()
+    try:
+        if storage.snapshots and (storage.stale or (pending and (compact or due))):
+            # Values are replaced, never mutated in place, so shallow copies are a consistent view
+            seq = journal_seq
+            with PERSIST_SECONDS.time('snapshot'):
+                await loop.run_in_executor(
+                    _persist_executor, storage.snapshot,
+                    seq, dict(active_tickets), dict(claimed_tickets), storage.snapshot_stats(), dict(pending_deletions)
+                )
+            snapshot_seq = seq
+            last_snapshot_at = time.monotonic()
+        elif records:
+            with PERSIST_SECONDS.time('write'):
+                await loop.run_in_executor(_persist_executor, storage.write, records)
+    except Exception:
+        # Keep the records queued so the next flush retries them
+        _pending_records[:0] = records
+        _pending_proofs[:0] = proofs
+        if records:
+            _pending_since = since
+        _dirty.set()
+        raise
+    last_flush_at = time.monotonic()
+    PERSIST_RECORDS.inc(amount=len(records))
+    
+    if proofs:
+        try:
+            with PERSIST_SECONDS.time('proof_history'):
+                await loop.run_in_executor(_persist_executor, proof_history.write, proofs)
+        except Exception:
+            _pending_proofs[:0] = proofs
+            _dirty.set()
+            raise
+
+async def persistence_loop():
+    """Coalesce dirty-state notifications into at most one flush per PERSIST_INTERVAL"""
+    global _flush_task
+    while True:
+        try:
+            await asyncio.wait_for(_dirty.wait(), timeout=COMPACT_CHECK)
+        except asyncio.TimeoutError:
+            pass
+        # Shielded: cancelling the loop must not drop a batch already taken off the queue
+        _flush_task = asyncio.ensure_future(flush_persistence())
+        try:
+            await asyncio.shield(_flush_task)
+        except Exception as e:
+            print(f'[ERROR] Persistence flush failed: {e}')
+        await asyncio.sleep(PERSIST_INTERVAL)
+
+async def query_store(method, *args):
+    """Run a storage query after the queued writes it has to observe"""
+    if storage.in_memory:
+        return method(*args)
+    if _pending_records:
+        await flush_persistence()
+    return await asyncio.get_running_loop().run_in_executor(_persist_executor, method, *args)
 
-def can_see_tier(user_roles, ticket_tier):
-    """Check if user with their roles can see a ticket of given tier"""
-    user_role_ids = [role.id for role in user_roles]
-    ticket_level = MM_TIERS[ticket_tier]['level']
+def load_data():
+    """Rebuild in-memory state from the storage backend"""
+    global journal_seq, snapshot_seq, last_snapshot_at
+    active_tickets.clear()
+    claimed_tickets.clear()
+    pending_deletions.clear()
+    mm_stats.clear()
+    guild_mm_stats.clear()
+    
+    guild_configs.reload(force=True)
+    journal_seq, snapshot_seq = storage.load()
+    mm_rank_index.rebuild(mm_stats)
+    last_snapshot_at = time.monotonic()
+    proof_history.load()
+
+# Tier authorization
+# A member's effective tier level is the highest level among their MM roles;
+# they can see every ticket at that level or below (OG, the top level, sees all).
+# The role -> level and tier -> viewer role tables are precomputed per guild
+# by GuildConfig.
+TIER_LEVELS = {tier: info['level'] for tier, info in MM_TIERS.items()}
+MAX_TIER_LEVEL = max(TIER_LEVELS.values())
+
+member_access_cache = {}  # guild id -> {member id: (tier level, is admin)}
+
+def compute_access(member):
+    role_levels = guild_configs.get(member.guild.id).role_levels
+    level = max((role_levels.get(role.id, 0) for role in member.roles), default=0)
+    return level, member.guild_permissions.administrator
+
+def member_access(member):
+    """(effective tier level, is admin) for a member, cached until their roles change"""
+    if LAZY_MEMBERS:
+        # Without a member cache discord.py drops member updates, so nothing would
+        # invalidate an entry; the invoking member's payload carries current roles
+        return compute_access(member)
+    cache = member_access_cache.get(member.guild.id)
+    if cache is None:
+        cache = member_access_cache[member.guild.id] = {}
+    access = cache.get(member.id)
+    if access is None:
+        access = cache[member.id] = compute_access(member)
+    return access
+
+def can_see_tier(member, ticket_tier):
+    """Check if a member can see (and claim) a ticket of the given tier"""
+    level, is_admin = member_access(member)
+    return is_admin or level >= TIER_LEVELS.get(ticket_tier, MAX_TIER_LEVEL + 1)
 
 def is_mm_or_admin(user, guild):
     """Check if user is MM or admin"""
-    # Check if admin
-    if user.guild_permissions.administrator:
-        return True
-    
-    # Check if user has any MM role
-    user_role_ids = [role.id for role in user.roles]
-    for role_id in MM_ROLE_IDS.values():
-        if role_id in user_role_ids:
-            return True
-    
-    return False
-    
-    # OG can see everything
-    if MM_ROLE_IDS['og'] in user_role_ids:
-        return True
-    
-    # Check if user has a role that matches or exceeds the ticket tier
-    for tier_key, role_id in MM_ROLE_IDS.items():
-        if role_id in user_role_ids:
-            user_level = MM_TIERS[tier_key]['level']
-            # User can only see tickets at their level or below (except OG sees all)
-            if tier_key == 'og':
-                return True
-            elif user_level >= ticket_level:
-                return True
-    
-    return False
+    level, is_admin = member_access(user)
+    return is_admin or level > 0
+
+# Channel overwrites
+# Claim and unclaim build the final overwrite map locally and apply it together
+# with the rename in one channel.edit() call.
+def claim_overwrites(channel, *members):
+    """Channel overwrites with the given members allowed to talk"""
+    overwrites = dict(channel.overwrites)
+    for member in members:
+        if member:
+            overwrites[member] = discord.PermissionOverwrite(
+                view_channel=True,
+                send_messages=True,
+                read_message_history=True
+            )
+    return overwrites
+
+def tier_role_overwrites(guild, tier):
+    """Overwrites for every MM role allowed to see a ticket of the given tier"""
+    return resolve_guild(guild).tier_overwrites[tier]
+
+def build_tier_overwrites(tier_roles, viewers):
+    """Build the role overwrites for one tier from the resolved tier roles and its viewer role ids"""
+    overwrites = {}
+    
+    for role in tier_roles.values():
+        if role and role.id in viewers:
+            overwrites[role] = discord.PermissionOverwrite(
+                view_channel=True,
+                send_messages=True,
+                read_message_history=True,
+                manage_messages=True
+            )
+    return overwrites
+
+# Guild configuration
+# Each guild's overrides of the defaults above are kept in GUILD_CONFIG_FILE
+# (one per partition when running a shard range), loaded once and cached as a
+# GuildConfig. The file is re-read when it changes on disk; every change drops
+# the guild's resolved roles/categories and cached member access.
+GUILD_CONFIG_FILE = 'guild_config.json'
+GUILD_CONFIG_RELOAD = 15  # seconds between checks for edits made on disk
+# key -> kind of value: a role, a channel or a category name
+GUILD_CONFIG_KEYS = {
+    'basic_role': 'role',
+    'advanced_role': 'role',
+    'premium_role': 'role',
+    'og_role': 'role',
+    'staff_role': 'role',
+    'proof_channel': 'channel',
+    'transcript_channel': 'channel',
+    'ticket_category': 'category',
+    'support_category': 'category',
+}
+
+class GuildConfig:
+    """Effective settings of one guild, with the tier lookup tables precomputed"""
+    __slots__ = ('mm_role_ids', 'staff_role_id', 'proof_channel_id', 'transcript_channel_id', 'ticket_category',
+                 'support_category', 'role_levels', 'tier_viewer_roles')
+    
+    def __init__(self, overrides):
+        self.mm_role_ids = {tier: overrides.get(f'{tier}_role', role_id) for tier, role_id in MM_ROLE_IDS.items()}
+        self.staff_role_id = overrides.get('staff_role', STAFF_ROLE_ID)
+        self.proof_channel_id = overrides.get('proof_channel', PROOF_CHANNEL_ID)
+        self.transcript_channel_id = overrides.get('transcript_channel', TRANSCRIPT_CHANNEL_ID)
+        self.ticket_category = overrides.get('ticket_category', TICKET_CATEGORY)
+        self.support_category = overrides.get('support_category', SUPPORT_CATEGORY)
+        
+        self.role_levels = {role_id: TIER_LEVELS[tier] for tier, role_id in self.mm_role_ids.items() if role_id}
+        # tier -> role ids allowed to see tickets of that tier
+        self.tier_viewer_roles = {
+            tier: frozenset(role_id for role_id, level in self.role_levels.items() if level >= ticket_level)
+            for tier, ticket_level in TIER_LEVELS.items()
+        }
+    
+    def value(self, key):
+        """Current value of a GUILD_CONFIG_KEYS entry"""
+        if key.endswith('_role') and key != 'staff_role':
+            return self.mm_role_ids[key[:-len('_role')]]
+        return {
+            'staff_role': self.staff_role_id,
+            'proof_channel': self.proof_channel_id,
+            'transcript_channel': self.transcript_channel_id,
+            'ticket_category': self.ticket_category,
+            'support_category': self.support_category,
+        }[key]
+
+class GuildConfigStore:
+    """Per-guild overrides, cached in memory and reloaded when their file changes"""
+    def __init__(self, path=GUILD_CONFIG_FILE):
+        self.path = path
+        self.overrides = {}  # guild id -> {key: value}
+        self.configs = {}    # guild id -> GuildConfig
+        self.mtimes = {}     # path -> mtime when last read
+    
+    def get(self, guild_id):
+        config = self.configs.get(guild_id)
+        if config is None:
+            config = self.configs[guild_id] = GuildConfig(self.overrides.get(guild_id, {}))
+        return config
+    
+    def files(self):
+        """guild id (None for the shared file) -> config file"""
+        if not PARTITIONED:
+            return {None: self.path}
+        return {guild_id: partition_file(guild_id, self.path) for guild_id in owned_partitions()}
+    
+    def reload(self, force=False):
+        """Re-read config files that changed, returns the ids of guilds whose settings changed"""
+        changed = set()
+        for owner, path in self.files().items():
+            try:
+                mtime = os.path.getmtime(path)
+            except FileNotFoundError:
+                continue
+            if not force and self.mtimes.get(path) == mtime:
+                continue
+            self.mtimes[path] = mtime
+            try:
+                with open(path, 'r') as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f'[ERROR] Could not read {path}: {e}')
+                continue
+            
+            entries = {int(guild_id): values for guild_id, values in data.items()} if owner is None else {owner: data}
+            stored = set(self.overrides) if owner is None else {owner}
+            for guild_id in stored | set(entries):
+                values = entries.get(guild_id, {})
+                if self.overrides.get(guild_id, {}) != values:
+                    self.overrides[guild_id] = values
+                    changed.add(guild_id)
+        
+        for guild_id in changed:
+            self.invalidate(guild_id)
+        return changed
+    
+    def invalidate(self, guild_id):
+        self.configs.pop(guild_id, None)
+        resolved_guilds.pop(guild_id, None)
+        member_access_cache.pop(guild_id, None)
+    
+    async def update(self, guild_id, key, value):
+        """Set (or with value None, reset) one key and save it"""
+        values = dict(self.overrides.get(guild_id, {}))
+        if value is None:
+            values.pop(key, None)
+        else:
+            values[key] = value
+        self.overrides[guild_id] = values
+        self.invalidate(guild_id)
+        
+        if PARTITIONED:
+            path, data = partition_file(guild_id, self.path), values
+        else:
+            path, data = self.path, {str(gid): v for gid, v in self.overrides.items() if v}
+        await asyncio.get_running_loop().run_in_executor(_persist_executor, self.write, path, data)
+    
+    def write(self, path, data):
+        tmp_file = path + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, path)
+        self.mtimes[path] = os.path.getmtime(path)
+
+guild_configs = GuildConfigStore()
+
+async def config_reload_loop():
+    """Pick up config files edited on disk without a restart"""
+    while True:
+        await asyncio.sleep(GUILD_CONFIG_RELOAD)
+        changed = guild_configs.reload()
+        if changed:
+            print(f'🔄 Reloaded config for {len(changed)} guild(s)')
+
+# Resolved guild config
+# Categories, roles and overwrite templates are looked up once per guild and
+# dropped again by the channel/role listeners below whenever they could change.
+resolved_guilds = {}  # guild id -> ResolvedGuild
+
+class ResolvedGuild:
+    """Per-guild categories, tier roles, staff role and tier overwrite templates"""
+    __slots__ = ('categories', 'tier_roles', 'staff_role', 'tier_overwrites')
+    
+    def __init__(self, guild):
+        config = guild_configs.get(guild.id)
+        self.categories = {}  # name -> CategoryChannel, filled by ensure_category()
+        self.tier_roles = {tier: guild.get_role(role_id) for tier, role_id in config.mm_role_ids.items() if role_id}
+        self.staff_role = guild.get_role(config.staff_role_id) if config.staff_role_id else None
+        # Shared templates, callers copy them into their own dict and never mutate them
+        self.tier_overwrites = {
+            tier: build_tier_overwrites(self.tier_roles, config.tier_viewer_roles[tier]) for tier in MM_TIERS
+        }
+
+def resolve_guild(guild):
+    resolved = resolved_guilds.get(guild.id)
+    if resolved is None:
+        resolved = resolved_guilds[guild.id] = ResolvedGuild(guild)
+    return resolved
+
+def invalidate_guild(guild):
+    resolved_guilds.pop(guild.id, None)
+
+# Member name lookup
+CF_NAME_MATCH = 'exact'   # 'exact', 'prefix' or 'fuzzy' fallback for $cf names
+FUZZY_CUTOFF = 0.8
+
+member_name_indexes = {}  # guild id -> MemberNameIndex
+
+class MemberNameIndex:
+    """Case-folded name and nick -> member ids for one guild"""
+    def __init__(self, members):
+        self.names = {}        # folded name or nick -> set of member ids
+        self.by_member = {}    # member id -> (folded name, folded nick)
+        self._sorted = None    # sorted keys, built lazily for prefix matching
+        for member in members:
+            self.add(member)
+    
+    def add(self, member):
+        self._set(member.id, member.name, member.nick)
+    
+    def _set(self, member_id, name, nick):
+        keys = (name.casefold(), nick.casefold() if nick else None)
+        self.by_member[member_id] = keys
+        for key in keys:
+            if key:
+                self.names.setdefault(key, set()).add(member_id)
+        self._sorted = None
+    
+    def remove(self, member_id):
+        for key in self.by_member.pop(member_id, ()):
+            ids = self.names.get(key)
+            if ids:
+                ids.discard(member_id)
+                if not ids:
+                    del self.names[key]
+        self._sorted = None
+    
+    def rename(self, member_id, name):
+        """Account-wide username change, the guild nick stays the same"""
+        keys = self.by_member.get(member_id)
+        if keys:
+            nick = keys[1]
+            self.remove(member_id)
+            self._set(member_id, name, nick)
+    
+    def find(self, query, mode='exact'):
+        """Return a member id matching query, or None"""
+        key = query.casefold()
+        ids = self.names.get(key)
+        if ids:
+            return next(iter(ids))
+        
+        if mode in ('prefix', 'fuzzy'):
+            if self._sorted is None:
+                self._sorted = sorted(self.names)
+            i = bisect_left(self._sorted, key)
+            if i < len(self._sorted) and self._sorted[i].startswith(key):
+                return next(iter(self.names[self._sorted[i]]))
+        
+        if mode == 'fuzzy':
+            close = difflib.get_close_matches(key, self.names.keys(), n=1, cutoff=FUZZY_CUTOFF)
+            if close:
+                return next(iter(self.names[close[0]]))
+        return None
+
+CF_QUERY_LIMIT = 10
+
+async def find_member_by_name(guild, query):
+    """Resolve a name or nick through the guild's lazily built index"""
+    if LAZY_MEMBERS:
+        return await query_member_by_name(guild, query)
+    index = member_name_indexes.get(guild.id)
+    if index is None:
+        index = member_name_indexes[guild.id] = MemberNameIndex(guild.members)
+    member_id = index.find(query, CF_NAME_MATCH)
+    return guild.get_member(member_id) if member_id else None
+
+async def query_member_by_name(guild, query):
+    """Ask the gateway for name/nick prefix matches when there is no member cache to index"""
+    try:
+        members = await guild.query_members(query, limit=CF_QUERY_LIMIT, cache=False)
+    except asyncio.TimeoutError:
+        return None
+    key = query.casefold()
+    for member in members:
+        if member.name.casefold() == key or (member.nick and member.nick.casefold() == key):
+            return member
+    # Gateway queries only match prefixes, so fuzzy matching degrades to prefix
+    return members[0] if members and CF_NAME_MATCH != 'exact' else None
+
+# Member fetch cache
+class MemberLRU:
+    """Recently fetched members, None for users no longer in the guild"""
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()  # (guild id, user id) -> (fetched at, member or None)
+    
+    def get(self, guild_id, user_id):
+        """Return (hit, member) for a fresh entry"""
+        key = (guild_id, user_id)
+        entry = self.entries.get(key)
+        if entry is None:
+            return False, None
+        if time.monotonic() - entry[0] > self.ttl:
+            del self.entries[key]
+            return False, None
+        self.entries.move_to_end(key)
+        return True, entry[1]
+    
+    def put(self, guild_id, user_id, member):
+        self.entries[(guild_id, user_id)] = (time.monotonic(), member)
+        self.entries.move_to_end((guild_id, user_id))
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+    
+    def discard(self, guild_id, user_id):
+        self.entries.pop((guild_id, user_id), None)
+    
+    def discard_guild(self, guild_id):
+        for key in [key for key in self.entries if key[0] == guild_id]:
+            del self.entries[key]
+
+member_lru = MemberLRU(MEMBER_LRU_SIZE, MEMBER_LRU_TTL)
+
+async def get_or_fetch_member(guild, user_id):
+    """Member from the cache, the LRU or a REST fetch, None if they left"""
+    member = guild.get_member(user_id)
+    if member is not None:
+        MEMBER_LOOKUPS.inc('cache')
+        return member
+    hit, member = member_lru.get(guild.id, user_id)
+    if hit:
+        MEMBER_LOOKUPS.inc('lru')
+        return member
+    MEMBER_LOOKUPS.inc('fetch')
+    try:
+        member = await guild.fetch_member(user_id)
+    except discord.NotFound:
+        member = None
+    member_lru.put(guild.id, user_id, member)
+    return member
 
 # MM Trade Details Modal
 class MMTradeModal(Modal, title='Middleman Trade Details'):
@@ -193,11 +1775,12 @@ class MMTradeModal(Modal, title='Middleman Trade Details'):
         self.add_item(self.both_join)
         self.add_item(self.tip)
 
+    @timed_callback('mm_trade_modal')
     async def on_submit(self, interaction: discord.Interaction):
         await interaction.response.defer(ephemeral=True)
         
         try:
-            await create_ticket_with_details(
+            await queue_ticket(interaction, lambda: create_ticket_with_details(
                 interaction.guild, 
                 interaction.user, 
                 self.tier,
@@ -206,7 +1789,7 @@ class MMTradeModal(Modal, title='Middleman Trade Details'):
                 self.receiving.value,
                 self.both_join.value,
                 self.tip.value if self.tip.value else 'None'
-            )
+            ), 'mm')
             await interaction.followup.send('✅ Middleman ticket created! Check the ticket channel.', ephemeral=True)
         except Exception as e:
             await interaction.followup.send(f'❌ Error creating ticket: {str(e)}', ephemeral=True)
@@ -235,16 +1818,17 @@ class SupportTicketModal(Modal, title='Open Support Ticket'):
         self.add_item(self.reason)
         self.add_item(self.details)
 
+    @timed_callback('support_modal')
     async def on_submit(self, interaction: discord.Interaction):
         await interaction.response.defer(ephemeral=True)
         
         try:
-            await create_support_ticket(
+            await queue_ticket(interaction, lambda: create_support_ticket(
                 interaction.guild, 
                 interaction.user,
                 self.reason.value,
                 self.details.value if self.details.value else 'None provided'
-            )
+            ), 'support')
             await interaction.followup.send('✅ Support ticket created! Check the ticket channel.', ephemeral=True)
         except Exception as e:
             await interaction.followup.send(f'❌ Error creating ticket: {str(e)}', ephemeral=True)
@@ -255,6 +1839,7 @@ class SupportTicketView(View):
         super().__init__(timeout=None)
     
     @discord.ui.button(label='🔒 Close Ticket', style=discord.ButtonStyle.danger, custom_id='close_support_ticket')
+    @timed_callback('support_close')
     async def close_button(self, interaction: discord.Interaction, button: Button):
         await interaction.response.defer()
         await close_ticket(interaction.channel, interaction.user)
@@ -265,6 +1850,7 @@ class MMSetupView(View):
         super().__init__(timeout=None)
     
     @discord.ui.button(label='Open MM Ticket', emoji='⚖️', style=discord.ButtonStyle.primary, custom_id='open_mm_ticket_main')
+    @timed_callback('mm_open')
     async def open_mm_button(self, interaction: discord.Interaction, button: Button):
         tier_embed = discord.Embed(
             title='Select your middleman tier:',
@@ -278,6 +1864,7 @@ class SupportSetupView(View):
         super().__init__(timeout=None)
     
     @discord.ui.button(label='Open Support Ticket', emoji='🎫', style=discord.ButtonStyle.primary, custom_id='open_support_ticket_main')
+    @timed_callback('support_open')
     async def open_support_button(self, interaction: discord.Interaction, button: Button):
         modal = SupportTicketModal()
         await interaction.response.send_modal(modal)
@@ -318,6 +1905,7 @@ class TierSelect(Select):
             custom_id='tier_select'
         )
     
+    @timed_callback('tier_select')
     async def callback(self, interaction: discord.Interaction):
         selected_tier = self.values[0]
         modal = MMTradeModal(selected_tier)
@@ -328,19 +1916,262 @@ class TierSelectView(View):
         super().__init__(timeout=None)
         self.add_item(TierSelect())
 
+# Coinflip engine
+CF_STREAK_LIMIT = 3     # after this many wins in a row the next flip is biased
+CF_STREAK_BREAK = 60    # percent chance that a biased flip breaks the streak
+CF_AUDIT_MATCHES = 100_000
+CF_AUDIT_MAX_MATCHES = 2_000_000
+CF_AUDIT_BATCH = 50_000
+CF_AUDIT_WORKERS = min(4, os.cpu_count() or 1)  # worker processes for audit simulations
+CF_AUDIT_PRESETS = [(False, 1), (False, 3), (False, 5), (False, 10), (True, 3), (True, 5), (True, 10)]
+
+def play_match(total_rounds, is_first_to, randbelow=secrets.randbelow):
+    """Play one match, returns the winner (1 or 2) of every round"""
+    winners = []
+    wins = [0, 0, 0]
+    last_winner = None
+    streak_count = 0
+    # First to X ends at X wins, Best of X ends at a majority or after X rounds
+    rounds_to_win = total_rounds if is_first_to else (total_rounds // 2) + 1
+    
+    while wins[1] < rounds_to_win and wins[2] < rounds_to_win and (is_first_to or len(winners) < total_rounds):
+        if streak_count >= CF_STREAK_LIMIT:
+            # Anti-streak: favor the other side
+            winner = 3 - last_winner if randbelow(100) < CF_STREAK_BREAK else last_winner
+        else:
+            winner = 1 + randbelow(2)
+        
+        wins[winner] += 1
+        if winner == last_winner:
+            streak_count += 1
+        else:
+            streak_count = 1
+            last_winner = winner
+        winners.append(winner)
+    
+    return winners
+
+class MatchStats:
+    """Aggregated outcome of simulated matches"""
+    __slots__ = ('matches', 'user1_wins', 'ties', 'rounds', 'streaks')
+    
+    def __init__(self):
+        self.matches = 0
+        self.user1_wins = 0
+        self.ties = 0
+        self.rounds = 0
+        self.streaks = {}  # streak length -> count
+    
+    def add(self, winners):
+        self.matches += 1
+        self.rounds += len(winners)
+        user1 = winners.count(1)
+        if user1 * 2 > len(winners):
+            self.user1_wins += 1
+        elif user1 * 2 == len(winners):
+            self.ties += 1
+        
+        streaks = self.streaks
+        run = 1
+        for previous, winner in zip(winners, winners[1:]):
+            if winner == previous:
+                run += 1
+            else:
+                streaks[run] = streaks.get(run, 0) + 1
+                run = 1
+        streaks[run] = streaks.get(run, 0) + 1
+    
+    def merge(self, other):
+        self.matches += other.matches
+        self.user1_wins += other.user1_wins
+        self.ties += other.ties
+        self.rounds += other.rounds
+        for length, count in other.streaks.items():
+            self.streaks[length] = self.streaks.get(length, 0) + count
+    
+    @property
+    def user1_rate(self):
+        decided = self.matches - self.ties
+        return self.user1_wins / decided if decided else 0.0
+    
+    @property
+    def expected_rounds(self):
+        return self.rounds / self.matches if self.matches else 0.0
+
+def simulate_matches(total_rounds, is_first_to, matches, seed=None):
+    """Play a batch of matches on a secrets-seeded PRNG"""
+    rng = random.Random(secrets.randbits(128) if seed is None else seed)
+    randbelow = rng.randrange
+    stats = MatchStats()
+    for _ in range(matches):
+        stats.add(play_match(total_rounds, is_first_to, randbelow))
+    return stats
+
+_audit_executor = None
+
+def audit_executor():
+    """Process pool for simulations, a thread would still hold the GIL against the event loop"""
+    global _audit_executor
+    if _audit_executor is None:
+        _audit_executor = ProcessPoolExecutor(max_workers=CF_AUDIT_WORKERS)
+    return _audit_executor
+
+async def run_simulation(total_rounds, is_first_to, matches):
+    """Simulate in CF_AUDIT_BATCH sized chunks spread over the audit worker processes"""
+    global _audit_executor
+    loop = asyncio.get_running_loop()
+    executor = audit_executor()
+    batches = [min(CF_AUDIT_BATCH, matches - start) for start in range(0, matches, CF_AUDIT_BATCH)]
+    try:
+        results = await asyncio.gather(*(
+            loop.run_in_executor(executor, simulate_matches, total_rounds, is_first_to, batch) for batch in batches
+        ))
+    except BrokenProcessPool:
+        # A worker died, start a fresh pool for the next audit
+        _audit_executor = None
+        raise
+    stats = MatchStats()
+    for result in results:
+        stats.merge(result)
+    return stats
+
+# Coinflip playback
+CF_FRAME_INTERVAL = 1.5   # minimum seconds between edits of a coinflip message
+CF_ROUND_DELAY = 1.5      # seconds per round for short matches
+CF_MAX_PLAYBACK = 30      # long matches are sped up to finish within this many seconds
+
+class MessageUpdater:
+    """Edits a message with only the latest pushed frame, at most once per interval"""
+    def __init__(self, message, interval):
+        self.message = message
+        self.interval = interval
+        self.latest = None
+        self.dropped = 0
+        self._closing = False
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+    
+    def push(self, **fields):
+        if self._task.done():
+            # Surface a failed edit (e.g. the message was deleted) to the match
+            self._task.result()
+        # An unsent frame is simply replaced, slow edits (429s) never build a backlog
+        if self.latest is not None:
+            self.dropped += 1
+        self.latest = fields
+        self._wake.set()
+    
+    async def _run(self):
+        while True:
+            if self.latest is None:
+                if self._closing:
+                    return
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+            
+            fields, self.latest = self.latest, None
+            started = time.monotonic()
+            await self.message.edit(**fields)
+            if self._closing and self.latest is None:
+                return
+            await asyncio.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+    
+    async def close(self, **fields):
+        """Send the final frame, dropping anything still pending, and wait for it"""
+        if fields:
+            self.push(**fields)
+        self._closing = True
+        self._wake.set()
+        await self._task
+    
+    def cancel(self):
+        self._task.cancel()
+
+# Coinflip match registry
+CF_MAX_PER_CHANNEL = 3    # matches waiting for sides or running, per channel
+CF_MAX_PER_GUILD = 15
+
+class MatchRegistry:
+    """Active coinflip matches per guild and channel, with concurrency limits"""
+    def __init__(self):
+        self.channels = {}  # channel id -> set of CoinflipView
+        self.guilds = {}    # guild id -> match count
+        self.messages = {}  # message id -> CoinflipView
+    
+    def reserve(self, view):
+        """Take a slot for the match, returns an error message when a limit is reached"""
+        if len(self.channels.get(view.channel_id, ())) >= CF_MAX_PER_CHANNEL:
+            return f'❌ There are already {CF_MAX_PER_CHANNEL} coinflips running in this channel, wait for one to finish!'
+        if self.guilds.get(view.guild_id, 0) >= CF_MAX_PER_GUILD:
+            return f'❌ There are already {CF_MAX_PER_GUILD} coinflips running in this server, wait for one to finish!'
+        
+        self.channels.setdefault(view.channel_id, set()).add(view)
+        self.guilds[view.guild_id] = self.guilds.get(view.guild_id, 0) + 1
+        return None
+    
+    def bind(self, view, message):
+        view.message = message
+        self.messages[message.id] = view
+    
+    def release(self, view):
+        channel = self.channels.get(view.channel_id)
+        if not channel or view not in channel:
+            return
+        
+        channel.discard(view)
+        if not channel:
+            del self.channels[view.channel_id]
+        self.guilds[view.guild_id] -= 1
+        if not self.guilds[view.guild_id]:
+            del self.guilds[view.guild_id]
+        if view.message:
+            self.messages.pop(view.message.id, None)
+    
+    def cancel(self, message_id):
+        view = self.messages.get(message_id)
+        if view:
+            view.cancel()
+    
+    def cancel_channel(self, channel_id):
+        for view in list(self.channels.get(channel_id, ())):
+            view.cancel()
+    
+    def cancel_guild(self, guild_id):
+        for views in list(self.channels.values()):
+            for view in list(views):
+                if view.guild_id == guild_id:
+                    view.cancel()
+    
+    @property
+    def active(self):
+        return sum(self.guilds.values())
+    
+    @property
+    def running(self):
+        return sum(1 for views in self.channels.values() for view in views if view.task)
+
+cf_matches = MatchRegistry()
+
 # Coinflip Button View
 class CoinflipView(View):
-    def __init__(self, user1, user2, total_rounds, is_first_to):
+    def __init__(self, user1, user2, total_rounds, is_first_to, channel, fast=False):
         super().__init__(timeout=60)
         self.user1 = user1
         self.user2 = user2
+        self.guild_id = channel.guild.id
+        self.channel_id = channel.id
+        self.message = None
+        self.task = None
         self.total_rounds = total_rounds
         self.is_first_to = is_first_to
+        self.fast = fast
         self.user1_choice = None
         self.user2_choice = None
         self.chosen_users = []
     
     @discord.ui.button(label='Heads', emoji='🪙', style=discord.ButtonStyle.primary, custom_id='heads_cf')
+    @timed_callback('cf_heads')
     async def heads_button(self, interaction: discord.Interaction, button: Button):
         if interaction.user.id not in [self.user1.id, self.user2.id]:
             return await interaction.response.send_message('❌ You are not part of this coinflip!', ephemeral=True)
@@ -371,10 +2202,10 @@ class CoinflipView(View):
         await interaction.response.edit_message(embed=embed, view=self)
         
         if len(self.chosen_users) == 2:
-            await asyncio.sleep(1)
-            await self.start_coinflip(interaction)
+            self.start()
     
     @discord.ui.button(label='Tails', emoji='🪙', style=discord.ButtonStyle.secondary, custom_id='tails_cf')
+    @timed_callback('cf_tails')
     async def tails_button(self, interaction: discord.Interaction, button: Button):
         if interaction.user.id not in [self.user1.id, self.user2.id]:
             return await interaction.response.send_message('❌ You are not part of this coinflip!', ephemeral=True)
@@ -405,10 +2236,42 @@ class CoinflipView(View):
         await interaction.response.edit_message(embed=embed, view=self)
         
         if len(self.chosen_users) == 2:
+            self.start()
+    
+    def roll_rounds(self):
+        """Play the whole match up front, returns a list of (flip_result, winner) with winner 1 or 2"""
+        choices = {1: self.user1_choice, 2: self.user2_choice}
+        return [(choices[winner], winner) for winner in play_match(self.total_rounds, self.is_first_to)]
+    
+    async def on_timeout(self):
+        if self.task is None:
+            cf_matches.release(self)
+    
+    def start(self):
+        # The match runs as its own task so it can be cancelled when its message goes away
+        self.stop()
+        self.task = asyncio.create_task(self.run_match())
+    
+    def cancel(self):
+        if self.task:
+            self.task.cancel()
+        else:
+            self.stop()
+            cf_matches.release(self)
+    
+    async def run_match(self):
+        try:
             await asyncio.sleep(1)
-            await self.start_coinflip(interaction)
+            await self.start_coinflip()
+        except (asyncio.CancelledError, discord.NotFound):
+            # Message or channel deleted mid-match
+            pass
+        except Exception as e:
+            print(f'[ERROR] Coinflip match failed: {e}')
+        finally:
+            cf_matches.release(self)
     
-    async def start_coinflip(self, interaction):
+    async def start_coinflip(self):
         for item in self.children:
             item.disabled = True
         
@@ -421,114 +2284,49 @@ class CoinflipView(View):
         )
         start_embed.timestamp = datetime.utcnow()
         
-        await interaction.message.edit(embed=start_embed, view=self)
-        await asyncio.sleep(2)
-        
-        user1_wins = 0
-        user2_wins = 0
-        rounds_played = 0
-        results = []
-        last_winner = None  # Track last winner
-        streak_count = 0    # Track streak length
-        
-        # FIXED: Different logic for First To vs Best Of
-        if self.is_first_to:
-            # First to X: Keep going until someone reaches X wins
-            while user1_wins < self.total_rounds and user2_wins < self.total_rounds:
-                # ANTI-STREAK LOGIC: If 3+ streak, slightly favor the other side
-                if streak_count >= 3:
-                    # 60% chance to break the streak
-                    rand_num = secrets.randbelow(100)
-                    if last_winner == 'user1':
-                        flip_result = self.user2_choice if rand_num < 60 else self.user1_choice
-                    else:
-                        flip_result = self.user1_choice if rand_num < 60 else self.user2_choice
-                else:
-                    # Normal 50/50 flip using secrets module
-                    flip_result = 'heads' if secrets.randbelow(2) == 0 else 'tails'
-                
-                rounds_played += 1
-                
-                if flip_result == self.user1_choice:
-                    user1_wins += 1
-                    results.append(f"Round {rounds_played}: **{flip_result.upper()}** - {self.user1.mention} wins! 🎉")
-                    if last_winner == 'user1':
-                        streak_count += 1
-                    else:
-                        streak_count = 1
-                        last_winner = 'user1'
-                else:
-                    user2_wins += 1
-                    results.append(f"Round {rounds_played}: **{flip_result.upper()}** - {self.user2.mention} wins! 🎉")
-                    if last_winner == 'user2':
-                        streak_count += 1
-                    else:
-                        streak_count = 1
-                        last_winner = 'user2'
-                
-                progress_embed = discord.Embed(
-                    title='🪙 Coinflip in Progress...',
-                    description=f'**{self.user1.mention}** ({self.user1_choice.upper()}): {user1_wins} wins\n**{self.user2.mention}** ({self.user2_choice.upper()}): {user2_wins} wins\n\n**Mode:** {mode_text}\n**Rounds Played:** {rounds_played}',
-                    color=0xFFA500
-                )
-                
-                recent_results = '\n'.join(results[-5:])
-                progress_embed.add_field(name='Recent Results', value=recent_results if recent_results else 'None yet', inline=False)
-                progress_embed.timestamp = datetime.utcnow()
-                
-                await interaction.message.edit(embed=progress_embed, view=self)
-                await asyncio.sleep(1.5)
-        else:
-            # Best of X: Play exactly X rounds, winner has most wins
-            rounds_to_win = (self.total_rounds // 2) + 1
-            
-            while rounds_played < self.total_rounds:
-                # ANTI-STREAK LOGIC
-                if streak_count >= 3:
-                    rand_num = secrets.randbelow(100)
-                    if last_winner == 'user1':
-                        flip_result = self.user2_choice if rand_num < 60 else self.user1_choice
-                    else:
-                        flip_result = self.user1_choice if rand_num < 60 else self.user2_choice
-                else:
-                    # Normal 50/50 flip using secrets module
-                    flip_result = 'heads' if secrets.randbelow(2) == 0 else 'tails'
-                
-                rounds_played += 1
-                
-                if flip_result == self.user1_choice:
-                    user1_wins += 1
-                    results.append(f"Round {rounds_played}: **{flip_result.upper()}** - {self.user1.mention} wins! 🎉")
-                    if last_winner == 'user1':
-                        streak_count += 1
-                    else:
-                        streak_count = 1
-                        last_winner = 'user1'
+        updater = MessageUpdater(self.message, CF_FRAME_INTERVAL)
+        try:
+            await self.play(updater, start_embed, mode_text)
+        finally:
+            updater.cancel()
+    
+    async def play(self, updater, start_embed, mode_text):
+        updater.push(embed=start_embed, view=self)
+        
+        rounds = self.roll_rounds()
+        rounds_played = len(rounds)
+        players = {1: self.user1, 2: self.user2}
+        results = [
+            f"Round {number}: **{flip_result.upper()}** - {players[winner].mention} wins! 🎉"
+            for number, (flip_result, winner) in enumerate(rounds, 1)
+        ]
+        user1_wins = sum(1 for _, winner in rounds if winner == 1)
+        user2_wins = rounds_played - user1_wins
+        
+        if not self.fast:
+            await asyncio.sleep(2)
+            # Rounds play on a fixed timeline, the updater only sends the newest frame
+            delay = min(CF_ROUND_DELAY, CF_MAX_PLAYBACK / rounds_played)
+            shown1 = shown2 = 0
+            for number, (_, winner) in enumerate(rounds[:-1], 1):
+                if winner == 1:
+                    shown1 += 1
                 else:
-                    user2_wins += 1
-                    results.append(f"Round {rounds_played}: **{flip_result.upper()}** - {self.user2.mention} wins! 🎉")
-                    if last_winner == 'user2':
-                        streak_count += 1
-                    else:
-                        streak_count = 1
-                        last_winner = 'user2'
-                
-                # Early finish if someone already won majority
-                if user1_wins >= rounds_to_win or user2_wins >= rounds_to_win:
-                    break
+                    shown2 += 1
                 
+                played_text = str(number) if self.is_first_to else f'{number}/{self.total_rounds}'
                 progress_embed = discord.Embed(
                     title='🪙 Coinflip in Progress...',
-                    description=f'**{self.user1.mention}** ({self.user1_choice.upper()}): {user1_wins} wins\n**{self.user2.mention}** ({self.user2_choice.upper()}): {user2_wins} wins\n\n**Mode:** {mode_text}\n**Rounds Played:** {rounds_played}/{self.total_rounds}',
+                    description=f'**{self.user1.mention}** ({self.user1_choice.upper()}): {shown1} wins\n**{self.user2.mention}** ({self.user2_choice.upper()}): {shown2} wins\n\n**Mode:** {mode_text}\n**Rounds Played:** {played_text}',
                     color=0xFFA500
                 )
                 
-                recent_results = '\n'.join(results[-5:])
+                recent_results = '\n'.join(results[max(0, number - 5):number])
                 progress_embed.add_field(name='Recent Results', value=recent_results if recent_results else 'None yet', inline=False)
                 progress_embed.timestamp = datetime.utcnow()
                 
-                await interaction.message.edit(embed=progress_embed, view=self)
-                await asyncio.sleep(1.5)
+                updater.push(embed=progress_embed, view=self)
+                await asyncio.sleep(delay)
         
         # Determine winner
         if user1_wins > user2_wins:
@@ -554,6 +2352,9 @@ class CoinflipView(View):
         final_embed.add_field(name='Mode', value=mode_text, inline=True)
         final_embed.add_field(name='Total Rounds', value=str(rounds_played), inline=True)
         
+        if self.fast:
+            final_embed.add_field(name='Results Summary', value=self.results_summary(rounds), inline=False)
+        
         if rounds_played <= 10:
             all_results = '\n'.join(results)
             final_embed.add_field(name='All Results', value=all_results, inline=False)
@@ -561,7 +2362,22 @@ class CoinflipView(View):
             recent_results = '\n'.join(results[-10:])
             final_embed.add_field(name='Last 10 Results', value=recent_results, inline=False)
         
-        await interaction.message.edit(embed=final_embed, view=self)
+        await updater.close(embed=final_embed, view=self)
+    
+    def results_summary(self, rounds):
+        """Heads/tails split and longest win streak of each player"""
+        heads = sum(1 for flip_result, _ in rounds if flip_result == 'heads')
+        longest = {1: 0, 2: 0}
+        streak = 0
+        last_winner = None
+        for _, winner in rounds:
+            streak = streak + 1 if winner == last_winner else 1
+            last_winner = winner
+            longest[winner] = max(longest[winner], streak)
+        return (
+            f'**Heads:** {heads} • **Tails:** {len(rounds) - heads}\n'
+            f'**Longest Streak:** {self.user1.mention} {longest[1]} • {self.user2.mention} {longest[2]}'
+        )
 
 # MM Ticket View
 class MMTicketView(View):
@@ -569,44 +2385,32 @@ class MMTicketView(View):
         super().__init__(timeout=None)
     
     @discord.ui.button(label='✅ Claim Ticket', style=discord.ButtonStyle.success, custom_id='claim_mm_ticket')
+    @timed_callback('mm_claim')
     async def claim_button(self, interaction: discord.Interaction, button: Button):
         # Get ticket tier
         ticket_data = active_tickets.get(interaction.channel.id)
         if not ticket_data:
             return await interaction.response.send_message('❌ Ticket data not found!', ephemeral=True)
         
-        ticket_tier = ticket_data.get('tier')
+        ticket_tier = ticket_data.tier_key
         
         # Check if user can claim this tier
-        if not can_see_tier(interaction.user.roles, ticket_tier) and not interaction.user.guild_permissions.administrator:
+        if not can_see_tier(interaction.user, ticket_tier):
             return await interaction.response.send_message('❌ You do not have permission to claim this ticket tier!', ephemeral=True)
         
         # Check if already claimed
         if interaction.channel.id in claimed_tickets:
+            # A raw mention needs no member lookup, which could outlast the 3s interaction window
             claimer_id = claimed_tickets[interaction.channel.id]
-            claimer = interaction.guild.get_member(claimer_id)
-            return await interaction.response.send_message(f'❌ This ticket is already claimed by {claimer.mention if claimer else "someone"}!', ephemeral=True)
+            return await interaction.response.send_message(f'❌ This ticket is already claimed by <@{claimer_id}>!', ephemeral=True)
         
-        claimed_tickets[interaction.channel.id] = interaction.user.id
+        record_mutation('claim', guild_id=interaction.guild.id, channel_id=interaction.channel.id, user_id=interaction.user.id)
         
-        ticket_creator_id = ticket_data.get('user_id')
-        ticket_creator = interaction.guild.get_member(ticket_creator_id) if ticket_creator_id else None
+        ticket_creator_id = ticket_data.user_id
+        ticket_creator = await get_or_fetch_member(interaction.guild, ticket_creator_id) if ticket_creator_id else None
         
         # Update permissions - only claimer and creator can talk
-        await interaction.channel.set_permissions(
-            interaction.user,
-            view_channel=True,
-            send_messages=True,
-            read_message_history=True
-        )
-        
-        if ticket_creator:
-            await interaction.channel.set_permissions(
-                ticket_creator,
-                view_channel=True,
-                send_messages=True,
-                read_message_history=True
-            )
+        overwrites = claim_overwrites(interaction.channel, interaction.user, ticket_creator)
         
         embed = discord.Embed(
             description=f'✅ Ticket claimed by {interaction.user.mention}\n\n🔒 **Only the claimer and ticket creator are allowed to talk.**',
@@ -615,10 +2419,10 @@ class MMTicketView(View):
         embed.timestamp = datetime.utcnow()
         
         await interaction.response.send_message(embed=embed)
-        await interaction.channel.edit(name=f"{interaction.channel.name}-claimed")
-        save_data()
+        await interaction.channel.edit(name=f"{interaction.channel.name}-claimed", overwrites=overwrites)
     
     @discord.ui.button(label='🔒 Close Ticket', style=discord.ButtonStyle.danger, custom_id='close_mm_ticket')
+    @timed_callback('mm_close')
     async def close_button(self, interaction: discord.Interaction, button: Button):
         await interaction.response.defer()
         await close_ticket(interaction.channel, interaction.user)
@@ -626,21 +2430,162 @@ class MMTicketView(View):
 # Events
 @bot.event
 async def on_ready():
+    if 'ready' not in startup_phases:
+        report_startup()
     print(f'✅ Bot is online as {bot.user}')
     print(f'📊 Serving {len(bot.guilds)} servers')
+    if SHARDED:
+        print(f'📡 Running shards {", ".join(map(str, sorted(bot.shards)))} of {bot.shard_count}')
     await bot.change_presence(activity=discord.Activity(type=discord.ActivityType.watching, name='Offical Boost Mm Bot'))
-    
-    bot.add_view(TierSelectView())
-    bot.add_view(MMTicketView())
-    bot.add_view(SupportTicketView())
-    bot.add_view(MMSetupView())
-    bot.add_view(SupportSetupView())
-    
-    load_data()
+
+@bot.listen('on_shard_ready')
+async def log_shard_ready(shard_id):
+    latency = bot.get_shard(shard_id).latency
+    print(f'📡 Shard {shard_id} ready ({latency * 1000:.0f}ms)' if math.isfinite(latency) else f'📡 Shard {shard_id} ready')
+
+@bot.listen('on_member_join')
+async def index_member_join(member):
+    index = member_name_indexes.get(member.guild.id)
+    if index:
+        index.add(member)
+
+@bot.listen('on_member_remove')
+async def index_member_remove(member):
+    index = member_name_indexes.get(member.guild.id)
+    if index:
+        index.remove(member.id)
+
+@bot.listen('on_member_update')
+async def index_member_update(before, after):
+    index = member_name_indexes.get(after.guild.id)
+    if index and (before.nick != after.nick or before.name != after.name):
+        index.remove(after.id)
+        index.add(after)
+
+@bot.listen('on_raw_member_remove')
+async def lru_member_remove(payload):
+    member_lru.discard(payload.guild_id, payload.user.id)
+
+@bot.listen('on_user_update')
+async def index_user_update(before, after):
+    if before.name != after.name:
+        for index in member_name_indexes.values():
+            index.rename(after.id, after.name)
+
+@bot.listen('on_guild_remove')
+async def index_guild_remove(guild):
+    member_name_indexes.pop(guild.id, None)
+    member_lru.discard_guild(guild.id)
+    member_access_cache.pop(guild.id, None)
+    invalidate_guild(guild)
+
+@bot.listen('on_guild_channel_create')
+async def resolved_channel_create(channel):
+    if isinstance(channel, discord.CategoryChannel):
+        invalidate_guild(channel.guild)
+
+@bot.listen('on_guild_channel_delete')
+async def resolved_channel_delete(channel):
+    if isinstance(channel, discord.CategoryChannel):
+        invalidate_guild(channel.guild)
+
+@bot.listen('on_guild_channel_update')
+async def resolved_channel_update(before, after):
+    if isinstance(after, discord.CategoryChannel) and before.name != after.name:
+        invalidate_guild(after.guild)
+
+@bot.listen('on_guild_role_create')
+async def resolved_role_create(role):
+    invalidate_guild(role.guild)
+
+@bot.listen('on_guild_role_delete')
+async def resolved_role_delete(role):
+    invalidate_guild(role.guild)
+    member_access_cache.pop(role.guild.id, None)
+
+@bot.listen('on_guild_role_update')
+async def resolved_role_update(before, after):
+    invalidate_guild(after.guild)
+    if before.permissions != after.permissions:
+        member_access_cache.pop(after.guild.id, None)
+
+@bot.listen('on_member_update')
+async def access_member_update(before, after):
+    if before.roles != after.roles:
+        member_access_cache.get(after.guild.id, {}).pop(after.id, None)
+
+@bot.listen('on_member_remove')
+async def access_member_remove(member):
+    member_access_cache.get(member.guild.id, {}).pop(member.id, None)
+
+@bot.listen('on_guild_update')
+async def access_guild_update(before, after):
+    if before.owner_id != after.owner_id:
+        member_access_cache.pop(after.id, None)
+
+@bot.listen('on_raw_message_delete')
+async def cf_message_delete(payload):
+    cf_matches.cancel(payload.message_id)
+
+@bot.listen('on_raw_bulk_message_delete')
+async def cf_bulk_message_delete(payload):
+    for message_id in payload.message_ids:
+        cf_matches.cancel(message_id)
+
+@bot.listen('on_guild_channel_delete')
+async def deletion_channel_delete(channel):
+    # Deleted by hand or by the worker, either way nothing is left to do
+    if channel.id in pending_deletions:
+        record_mutation('deleted', guild_id=channel.guild.id, channel_id=channel.id)
+
+@bot.listen('on_guild_channel_delete')
+async def cf_channel_delete(channel):
+    cf_matches.cancel_channel(channel.id)
+
+@bot.listen('on_guild_remove')
+async def cf_guild_remove(guild):
+    cf_matches.cancel_guild(guild.id)
+
+@bot.listen('on_command')
+async def metrics_command_start(ctx):
+    ctx.metrics_started = time.perf_counter()
+
+@bot.listen('on_command_completion')
+async def metrics_command_done(ctx):
+    observe_command(ctx, 'ok')
+
+@bot.listen('on_command_error')
+async def metrics_command_error(ctx, error):
+    observe_command(ctx, 'error')
+
+@bot.listen('on_command_error')
+async def command_error(ctx, error):
+    # Any on_command_error listener switches off discord.py's default error log
+    if isinstance(error, commands.CheckFailure):
+        print(f'[ERROR] {ctx.prefix}{ctx.invoked_with} refused for {ctx.author}: {error}')
+        message = '❌ You do not have permission to use this command!'
+    else:
+        print(f'[ERROR] {ctx.prefix}{ctx.invoked_with} failed: {error}')
+        traceback.print_exception(type(error), error, error.__traceback__)
+        message = '❌ Something went wrong running this command.'
+    
+    if ctx.interaction is not None:
+        # A slash command that never answers shows "The application did not respond"
+        if not ctx.interaction.response.is_done():
+            await ctx.send(message, ephemeral=True)
+    elif isinstance(error, commands.CheckFailure):
+        await ctx.reply(message)
+
+def observe_command(ctx, outcome):
+    # Unknown commands never reach on_command
+    started = getattr(ctx, 'metrics_started', None)
+    if ctx.command is not None and started is not None:
+        COMMAND_SECONDS.observe((ctx.command.qualified_name, outcome), time.perf_counter() - started)
 
 # Setup Command
-@bot.command(name='mmsetup')
+@bot.hybrid_command(name='mmsetup')
 @commands.has_permissions(administrator=True)
+@app_commands.default_permissions(administrator=True)
 async def setup(ctx):
     """Create MM ticket panel"""
     embed = discord.Embed(
@@ -664,11 +2609,13 @@ async def setup(ctx):
     view.add_item(button)
     
     await ctx.send(embed=embed, view=MMSetupView())
-    await ctx.message.delete()
+    if ctx.interaction is None:
+        await ctx.message.delete()
 
 # Support Setup Command
-@bot.command(name='supportsetup')
+@bot.hybrid_command(name='supportsetup')
 @commands.has_permissions(administrator=True)
+@app_commands.default_permissions(administrator=True)
 async def support_setup(ctx):
     """Create Support ticket panel"""
     embed = discord.Embed(
@@ -690,10 +2637,82 @@ async def support_setup(ctx):
     view.add_item(button)
     
     await ctx.send(embed=embed, view=SupportSetupView())
-    await ctx.message.delete()
+    if ctx.interaction is None:
+        await ctx.message.delete()
+
+# Config Command
+@bot.hybrid_command(name='config')
+@commands.has_permissions(administrator=True)
+@app_commands.default_permissions(administrator=True)
+@app_commands.describe(action='set, reset or reload', key='Setting to change', value='Role, channel or category name')
+async def config_command(ctx, action: str = None, key: str = None, *, value: str = None):
+    """
+    View or change this server's settings
+    Usage: $config
+           $config set <key> <value>
+           $config reset <key>
+           $config reload
+    """
+    usage = '❌ Usage: `$config`, `$config set <key> <value>`, `$config reset <key>` or `$config reload`'
+    
+    if action is None:
+        config = guild_configs.get(ctx.guild.id)
+        overrides = guild_configs.overrides.get(ctx.guild.id, {})
+        lines = []
+        for name, kind in GUILD_CONFIG_KEYS.items():
+            current = config.value(name)
+            if not current:
+                shown = 'Not set'
+            elif kind == 'role':
+                shown = f'<@&{current}>'
+            elif kind == 'channel':
+                shown = f'<#{current}>'
+            else:
+                shown = current
+            lines.append(f'`{name}`: {shown}' + ('' if name in overrides else ' *(default)*'))
+        
+        embed = discord.Embed(
+            title='⚙️ Server Configuration',
+            description='\n'.join(lines),
+            color=MM_COLOR
+        )
+        embed.set_footer(text='$config set <key> <value> • $config reset <key> • $config reload')
+        return await ctx.reply(embed=embed)
+    
+    action = action.lower()
+    if action == 'reload':
+        changed = guild_configs.reload(force=True)
+        return await ctx.reply(f'🔄 Config reloaded from disk ({len(changed)} server(s) changed).')
+    
+    if action not in ('set', 'reset'):
+        return await ctx.reply(usage)
+    if key not in GUILD_CONFIG_KEYS:
+        return await ctx.reply(f'❌ Unknown key! Available keys: {", ".join(f"`{name}`" for name in GUILD_CONFIG_KEYS)}')
+    
+    if action == 'reset':
+        await guild_configs.update(ctx.guild.id, key, None)
+        return await ctx.reply(f'✅ `{key}` reset to the default.')
+    
+    if not value:
+        return await ctx.reply(usage)
+    
+    kind = GUILD_CONFIG_KEYS[key]
+    if kind == 'category':
+        parsed = shown = value.strip()[:100]
+    else:
+        target_id = value.strip().strip('<@&#!>')
+        target = None
+        if target_id.isdigit():
+            target = ctx.guild.get_role(int(target_id)) if kind == 'role' else ctx.guild.get_channel(int(target_id))
+        if target is None:
+            return await ctx.reply(f'❌ Could not find that {kind}! Use a mention or an ID.')
+        parsed, shown = target.id, target.mention
+    
+    await guild_configs.update(ctx.guild.id, key, parsed)
+    await ctx.reply(f'✅ `{key}` set to {shown}')
 
 # Claim Command
-@bot.command(name='claim')
+@bot.hybrid_command(name='claim')
 async def claim(ctx):
     """Claim a ticket"""
     
@@ -713,30 +2732,17 @@ async def claim(ctx):
     if not ticket_data:
         return await ctx.reply('❌ Ticket data not found!')
     
-    ticket_tier = ticket_data.get('tier')
+    ticket_tier = ticket_data.tier_key
     
-    if not can_see_tier(ctx.author.roles, ticket_tier) and not ctx.author.guild_permissions.administrator:
+    if not can_see_tier(ctx.author, ticket_tier):
         return await ctx.reply('❌ You do not have permission to claim this ticket tier!')
 
-    claimed_tickets[ctx.channel.id] = ctx.author.id
-    
-    ticket_creator_id = ticket_data.get('user_id')
-    ticket_creator = ctx.guild.get_member(ticket_creator_id) if ticket_creator_id else None
+    record_mutation('claim', guild_id=ctx.guild.id, channel_id=ctx.channel.id, user_id=ctx.author.id)
     
-    await ctx.channel.set_permissions(
-        ctx.author,
-        view_channel=True,
-        send_messages=True,
-        read_message_history=True
-    )
+    ticket_creator_id = ticket_data.user_id
+    ticket_creator = await get_or_fetch_member(ctx.guild, ticket_creator_id) if ticket_creator_id else None
     
-    if ticket_creator:
-        await ctx.channel.set_permissions(
-            ticket_creator,
-            view_channel=True,
-            send_messages=True,
-            read_message_history=True
-        )
+    overwrites = claim_overwrites(ctx.channel, ctx.author, ticket_creator)
     
     embed = discord.Embed(
         description=f'✅ Ticket claimed by {ctx.author.mention}\n\n🔒 **Only the claimer and ticket creator can now send messages.**',
@@ -745,11 +2751,10 @@ async def claim(ctx):
     embed.timestamp = datetime.utcnow()
 
     await ctx.send(embed=embed)
-    await ctx.channel.edit(name=f"{ctx.channel.name}-claimed")
-    save_data()
+    await ctx.channel.edit(name=f"{ctx.channel.name}-claimed", overwrites=overwrites)
 
 # Close Command
-@bot.command(name='close')
+@bot.hybrid_command(name='close')
 async def close_command(ctx):
     """Close a ticket"""
     
@@ -790,7 +2795,8 @@ async def close_command(ctx):
     await ctx.reply(embed=embed, view=view)
 
 # Add/Remove User Commands
-@bot.command(name='add')
+@bot.hybrid_command(name='add')
+@app_commands.describe(member='Member to add to the ticket')
 async def add_user(ctx, member: discord.Member = None):
     """Add user to ticket"""
 
@@ -814,7 +2820,8 @@ async def add_user(ctx, member: discord.Member = None):
 
     await ctx.reply(embed=embed)
 
-@bot.command(name='remove')
+@bot.hybrid_command(name='remove')
+@app_commands.describe(member='Member to remove from the ticket')
 async def remove_user(ctx, member: discord.Member = None):
     """Remove user from ticket"""
 
@@ -842,29 +2849,30 @@ async def remove_user(ctx, member: discord.Member = None):
     await ctx.reply(embed=embed)
 
 # Proof Command
-@bot.command(name='proof')
+@bot.hybrid_command(name='proof')
 async def proof_command(ctx):
     """Send MM proof to proof channel"""
-    PROOF_CHANNEL_ID = 1458163922262560840
-
-# Permission check
+    # Permission check
     if not is_mm_or_admin(ctx.author, ctx.guild):
         return await ctx.reply('❌ You do not have permission to use this command!')
     
     if not ctx.channel.name.startswith('ticket-'):
         return await ctx.reply('❌ This command can only be used in a ticket.')
 
+    # Posting to the proof channel can outlast the 3s slash command window
+    await ctx.defer()
+
     ticket = active_tickets.get(ctx.channel.id)
     if not ticket:
         return await ctx.reply('❌ No ticket data found.')
 
-    requester = ctx.guild.get_member(ticket['user_id'])
-    trader = ticket.get('trader', 'Unknown')
-    giving = ticket.get('giving', 'Unknown')
-    receiving = ticket.get('receiving', 'Unknown')
-    tier = ticket.get('tier', 'Unknown')
+    requester = await get_or_fetch_member(ctx.guild, ticket.user_id)
+    trader = ticket.trader or 'Unknown'
+    giving = ticket.giving or 'Unknown'
+    receiving = ticket.receiving or 'Unknown'
+    tier = ticket.tier_key or 'Unknown'
 
-    proof_channel = ctx.guild.get_channel(PROOF_CHANNEL_ID)
+    proof_channel = ctx.guild.get_channel(guild_configs.get(ctx.guild.id).proof_channel_id)
 
     if not proof_channel:
         return await ctx.reply('❌ Proof channel not found.')
@@ -888,16 +2896,21 @@ async def proof_command(ctx):
     await proof_channel.send(embed=embed)
     
     # NEW: Track MM stats
-    user_id_str = str(ctx.author.id)
-    if user_id_str not in mm_stats:
-        mm_stats[user_id_str] = 0
-    mm_stats[user_id_str] += 1
-    save_data()
+    record_mutation(
+        'proof',
+        guild_id=ctx.guild.id,
+        user_id=str(ctx.author.id),
+        channel_id=ctx.channel.id,
+        tier=tier,
+        requester_id=ticket.user_id,
+        trader=trader,
+        created_at=ticket.created_at
+    )
     
     await ctx.reply('✅ Proof sent successfully!')
 
 # Help Command
-@bot.command(name='help')
+@bot.hybrid_command(name='help')
 async def help_command(ctx):
     """Show all available commands"""
     embed = discord.Embed(
@@ -910,6 +2923,7 @@ async def help_command(ctx):
         name='🎫 Ticket Commands',
         value='`$mmsetup` - Create MM ticket panel (Admin only)\n'
               '`$supportsetup` - Create Support ticket panel (Admin only)\n'
+              '`$config` - View or change server settings (Admin only)\n'
               '`$claim` - Claim a ticket\n'
               '`$unclaim` - Unclaim a ticket\n'
               '`$close` - Close a ticket\n'
@@ -922,7 +2936,8 @@ async def help_command(ctx):
     embed.add_field(
         name='📊 Statistics Commands',
         value='`$mmstats [@user]` - View MM statistics\n'
-              '`$mmleaderboard` - View top middlemen',
+              '`$mmleaderboard [page]` - View top middlemen\n'
+              '`$tradestats` - View trades per tier and completion times',
         inline=False
     )
     
@@ -930,25 +2945,36 @@ async def help_command(ctx):
         name='🪙 Coinflip Commands',
         value='`$cf @user1 vs @user2 ft <number>` - First to X wins\n'
               '`$coinflip` - Flip a single coin (heads or tails)\n'
-              '`$cf @user1 vs @user2 bo <number>` - Best of X rounds\n\n'
+              '`$cfaudit [ft|bo <number>]` - Simulate matches to check fairness (Admin only)\n'
+              '`$cfstatus` - Show running coinflip matches (Admin only)\n'
+              '`$cf @user1 vs @user2 bo <number>` - Best of X rounds\n'
+              'Add `fast` to skip the animation and only show the result\n\n'
               '**Examples:**\n'
               '• `$cf @user1 vs @user2 ft 10` (First to reach 10 wins)\n'
-              '• `$cf @user1 vs @user2 bo 10` (Best of 10 rounds, need 6 to win)',
+              '• `$cf @user1 vs @user2 bo 10` (Best of 10 rounds, need 6 to win)\n'
+              '• `$cf @user1 vs @user2 ft 100 fast` (Final result and summary only)',
+        inline=False
+    )
+    
+    embed.add_field(
+        name='⚡ Slash Commands',
+        value='Every command also works as a slash command, e.g. `/claim` or `/mmstats`.\n'
+              '`/cf` picks both players from the member list.',
         inline=False
     )
     
-    embed.set_footer(text='Use $help to see this message again')
+    embed.set_footer(text='Use $help or /help to see this message again')
     
     await ctx.reply(embed=embed)
 
 # MM Stats Command
-@bot.command(name='mmstats')
+@bot.hybrid_command(name='mmstats')
+@app_commands.describe(member='Middleman to look up, defaults to you')
 async def mmstats_command(ctx, member: discord.Member = None):
     """View MM statistics for a user"""
     target = member if member else ctx.author
-    user_id_str = str(target.id)
     
-    tickets_completed = mm_stats.get(user_id_str, 0)
+    tickets_completed, rank, total = await query_store(storage.mm_summary, target.id)
     
     embed = discord.Embed(
         title=f'📊 Middleman Statistics',
@@ -962,14 +2988,18 @@ async def mmstats_command(ctx, member: discord.Member = None):
         inline=False
     )
     
-    # Calculate rank
-    sorted_stats = sorted(mm_stats.items(), key=lambda x: x[1], reverse=True)
-    rank = next((i + 1 for i, (uid, _) in enumerate(sorted_stats) if uid == user_id_str), None)
-    
     if rank:
         embed.add_field(
             name='🏆 Rank',
-            value=f'#{rank} out of {len(mm_stats)} middlemen',
+            value=f'#{rank} out of {total} middlemen',
+            inline=False
+        )
+    
+    by_tier = proof_history.mm_tiers(target.id)
+    if any(by_tier.values()):
+        embed.add_field(
+            name='📊 By Tier',
+            value='\n'.join(f"{MM_TIERS[t]['emoji']} {MM_TIERS[t]['range']}: **{n}**" for t, n in by_tier.items()),
             inline=False
         )
     
@@ -978,14 +3008,23 @@ async def mmstats_command(ctx, member: discord.Member = None):
     await ctx.reply(embed=embed)
 
 # MM Leaderboard Command
-@bot.command(name='mmleaderboard')
-async def mmleaderboard_command(ctx):
+LEADERBOARD_PAGE_SIZE = 10
+
+@bot.hybrid_command(name='mmleaderboard')
+@app_commands.describe(page='Leaderboard page')
+async def mmleaderboard_command(ctx, page: int = 1):
     """View top middlemen leaderboard"""
-    if not mm_stats:
+    if page < 1:
+        return await ctx.reply('❌ Page must be 1 or higher!')
+    
+    offset = (page - 1) * LEADERBOARD_PAGE_SIZE
+    top_stats, total = await query_store(storage.mm_leaderboard, LEADERBOARD_PAGE_SIZE, offset)
+    if not total:
         return await ctx.reply('❌ No middleman statistics available yet!')
     
-    # Sort by tickets completed
-    sorted_stats = sorted(mm_stats.items(), key=lambda x: x[1], reverse=True)
+    pages = (total + LEADERBOARD_PAGE_SIZE - 1) // LEADERBOARD_PAGE_SIZE
+    if page > pages:
+        return await ctx.reply(f'❌ There are only {pages} leaderboard pages!')
     
     embed = discord.Embed(
         title='🏆 Middleman Leaderboard',
@@ -993,10 +3032,9 @@ async def mmleaderboard_command(ctx):
         color=MM_COLOR
     )
     
-    # Show top 10
+    members = await asyncio.gather(*(get_or_fetch_member(ctx.guild, user_id) for user_id, _ in top_stats))
     leaderboard_text = []
-    for i, (user_id, tickets) in enumerate(sorted_stats[:10], 1):
-        member = ctx.guild.get_member(int(user_id))
+    for i, ((user_id, tickets), member) in enumerate(zip(top_stats, members), offset + 1):
         if member:
             medal = '🥇' if i == 1 else '🥈' if i == 2 else '🥉' if i == 3 else f'{i}.'
             leaderboard_text.append(f'{medal} {member.mention} has completed **{tickets}** middleman tickets')
@@ -1006,12 +3044,53 @@ async def mmleaderboard_command(ctx):
     else:
         embed.description = 'No data available'
     
-    embed.set_footer(text=f'Total Middlemen: {len(mm_stats)}')
+    embed.set_footer(text=f'Total Middlemen: {total} • Page {page}/{pages}')
+    
+    await ctx.reply(embed=embed)
+
+def format_duration(seconds):
+    """Render seconds as a short human readable duration"""
+    if seconds is None:
+        return 'N/A'
+    minutes, secs = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    days, hours = divmod(hours, 24)
+    if days:
+        return f'{days}d {hours}h'
+    if hours:
+        return f'{hours}h {minutes}m'
+    if minutes:
+        return f'{minutes}m {secs}s'
+    return f'{secs}s'
+
+# Trade Stats Command
+@bot.hybrid_command(name='tradestats')
+async def tradestats_command(ctx):
+    """View completed trades per tier and time to completion"""
+    embed = discord.Embed(
+        title='📈 Trade Statistics',
+        description=f'**{proof_history.trades_since(1)}** trades today\n'
+                    f'**{proof_history.trades_since(7)}** trades this week\n'
+                    f'**{proof_history.total}** trades all time\n'
+                    f'Median time to completion: **{format_duration(proof_history.median_duration())}**',
+        color=MM_COLOR
+    )
+    
+    for tier_key, tier in MM_TIERS.items():
+        embed.add_field(
+            name=f"{tier['emoji']} {tier['name']}",
+            value=f'This week: **{proof_history.trades_since(7, tier_key)}**\n'
+                  f'All time: **{proof_history.by_tier.get(TIER_CODES[tier_key], 0)}**\n'
+                  f'Median: **{format_duration(proof_history.median_duration(tier_key))}**',
+            inline=True
+        )
+    
+    embed.timestamp = datetime.utcnow()
     
     await ctx.reply(embed=embed)
 
 # Unclaim Command
-@bot.command(name='unclaim')
+@bot.hybrid_command(name='unclaim')
 async def unclaim_command(ctx):
     """Unclaim a ticket"""
     if not ctx.channel.name.startswith('ticket-'):
@@ -1023,7 +3102,7 @@ async def unclaim_command(ctx):
     claimer_id = claimed_tickets[ctx.channel.id]
     
     # Check if user is the claimer or has admin perms
-    if ctx.author.id != claimer_id and not ctx.author.guild_permissions.administrator:
+    if ctx.author.id != claimer_id and not member_access(ctx.author)[1]:
         return await ctx.reply('❌ Only the ticket claimer or administrators can unclaim this ticket!')
     
     # Get ticket data to restore proper permissions
@@ -1031,32 +3110,18 @@ async def unclaim_command(ctx):
     if not ticket_data:
         return await ctx.reply('❌ Ticket data not found!')
     
-    ticket_tier = ticket_data.get('tier')
-    ticket_creator_id = ticket_data.get('user_id')
-    ticket_creator = ctx.guild.get_member(ticket_creator_id) if ticket_creator_id else None
+    ticket_tier = ticket_data.tier_key
     
     # Remove claim
-    del claimed_tickets[ctx.channel.id]
+    record_mutation('unclaim', guild_id=ctx.guild.id, channel_id=ctx.channel.id)
     
     # Restore permissions for all MM roles that can see this tier
-    ticket_level = MM_TIERS[ticket_tier]['level']
-    
-    for tier_key, role_id in MM_ROLE_IDS.items():
-        role = ctx.guild.get_role(role_id)
-        if role:
-            tier_level = MM_TIERS[tier_key]['level']
-            if tier_key == 'og' or tier_level >= ticket_level:
-                await ctx.channel.set_permissions(
-                    role,
-                    view_channel=True,
-                    send_messages=True,
-                    read_message_history=True,
-                    manage_messages=True
-                )
+    overwrites = dict(ctx.channel.overwrites)
+    overwrites.update(tier_role_overwrites(ctx.guild, ticket_tier))
     
     # Reset channel name
     new_name = ctx.channel.name.replace('-claimed', '')
-    await ctx.channel.edit(name=new_name)
+    await ctx.channel.edit(name=new_name, overwrites=overwrites)
     
     embed = discord.Embed(
         description=f'✅ Ticket unclaimed by {ctx.author.mention}\n\n🔓 **All eligible middlemen can now claim this ticket again.**',
@@ -1064,10 +3129,9 @@ async def unclaim_command(ctx):
     )
     
     await ctx.reply(embed=embed)
-    save_data()
 
 # Simple Coinflip Command
-@bot.command(name='coinflip')
+@bot.hybrid_command(name='coinflip')
 async def simple_coinflip(ctx):
     """Flip a single coin"""
     
@@ -1096,11 +3160,12 @@ async def simple_coinflip(ctx):
 
 # Coinflip Command
 @bot.command(name='cf')
-async def coinflip(ctx, user1_input: str = None, vs: str = None, user2_input: str = None, mode: str = None, rounds: int = None):
+async def coinflip(ctx, user1_input: str = None, vs: str = None, user2_input: str = None, mode: str = None, rounds: str = None, speed: str = None):
     """
     Coinflip command
     Usage: $cf @user1 vs @user2 ft 3
            $cf user1 vs user2 5
+           $cf user1 vs user2 ft 50 fast
     """
     # Validate inputs
     if not all([user1_input, vs, user2_input]):
@@ -1117,21 +3182,21 @@ async def coinflip(ctx, user1_input: str = None, vs: str = None, user2_input: st
     if user1_input.startswith('<@'):
         try:
             user_id = int(user1_input.strip('<@!>'))
-            user1 = ctx.guild.get_member(user_id)
+            user1 = await get_or_fetch_member(ctx.guild, user_id)
         except:
             pass
     else:
-        user1 = discord.utils.find(lambda m: m.name.lower() == user1_input.lower() or (m.nick and m.nick.lower() == user1_input.lower()), ctx.guild.members)
+        user1 = await find_member_by_name(ctx.guild, user1_input)
     
     # Try to find user2
     if user2_input.startswith('<@'):
         try:
             user_id = int(user2_input.strip('<@!>'))
-            user2 = ctx.guild.get_member(user_id)
+            user2 = await get_or_fetch_member(ctx.guild, user_id)
         except:
             pass
     else:
-        user2 = discord.utils.find(lambda m: m.name.lower() == user2_input.lower() or (m.nick and m.nick.lower() == user2_input.lower()), ctx.guild.members)
+        user2 = await find_member_by_name(ctx.guild, user2_input)
     
     if not user1:
         return await ctx.reply(f'❌ Could not find user: {user1_input}')
@@ -1144,19 +3209,45 @@ async def coinflip(ctx, user1_input: str = None, vs: str = None, user2_input: st
     
     if mode:
         if mode.lower() == 'ft':
-            if rounds is None:
+            if rounds is None or not rounds.isdigit():
                 return await ctx.reply('❌ Please specify the number of rounds for "ft" mode!\nExample: `$cf @user1 vs @user2 ft 3`')
             is_first_to = True
-            total_rounds = rounds
+            total_rounds = int(rounds)
         elif mode.isdigit():
             total_rounds = int(mode)
             is_first_to = False
+            speed, rounds = rounds, None
         else:
             return await ctx.reply('❌ Invalid mode! Use "ft" for first to, or just a number for best of.')
     
+    if speed is not None and speed.lower() != 'fast':
+        return await ctx.reply('❌ Invalid option! Add "fast" to only show the final result.\nExample: `$cf @user1 vs @user2 ft 50 fast`')
+    fast = speed is not None
+    
     if total_rounds < 1 or total_rounds > 200:
         return await ctx.reply('❌ Number of rounds must be between 1 and 200!')
     
+    await open_coinflip(ctx, user1, user2, total_rounds, is_first_to, fast)
+
+@bot.tree.command(name='cf', description='Start a coinflip match between two members')
+@app_commands.describe(
+    user1='First player',
+    user2='Second player',
+    rounds='Number of rounds (1-200)',
+    mode='First to X wins or best of X rounds',
+    fast='Skip the animation and only show the result'
+)
+@app_commands.choices(mode=[
+    app_commands.Choice(name='Best of', value='bo'),
+    app_commands.Choice(name='First to', value='ft')
+])
+async def coinflip_slash(interaction: discord.Interaction, user1: discord.Member, user2: discord.Member, rounds: app_commands.Range[int, 1, 200] = 1, mode: str = 'bo', fast: bool = False):
+    ctx = await bot.get_context(interaction)
+    with COMMAND_SECONDS.time('cf'):
+        await open_coinflip(ctx, user1, user2, rounds, mode == 'ft', fast)
+
+async def open_coinflip(ctx, user1, user2, total_rounds, is_first_to, fast):
+    """Post the side picker for a parsed $cf or /cf match"""
     # Create initial embed
     mode_text = f"First to {total_rounds}" if is_first_to else f"Best of {total_rounds}"
     
@@ -1167,17 +3258,162 @@ async def coinflip(ctx, user1_input: str = None, vs: str = None, user2_input: st
     )
     
     
-    view = CoinflipView(user1, user2, total_rounds, is_first_to)
-    await ctx.send(embed=embed, view=view)
+    view = CoinflipView(user1, user2, total_rounds, is_first_to, ctx.channel, fast=fast)
+    limit = cf_matches.reserve(view)
+    if limit:
+        return await ctx.reply(limit, ephemeral=True)
+    
+    try:
+        msg = await ctx.send(embed=embed, view=view)
+    except discord.HTTPException:
+        cf_matches.release(view)
+        raise
+    cf_matches.bind(view, msg)
+
+# Coinflip Audit Command
+@bot.hybrid_command(name='cfaudit')
+@commands.has_permissions(administrator=True)
+@app_commands.default_permissions(administrator=True)
+@app_commands.describe(mode='ft (first to) or bo (best of)', rounds='Number of rounds (1-200)', matches='Matches to simulate per mode')
+async def cfaudit_command(ctx, mode: str = None, rounds: str = None, matches: str = None):
+    """
+    Simulate coinflip matches to audit fairness
+    Usage: $cfaudit
+           $cfaudit ft 10 [matches]
+           $cfaudit bo 5 [matches]
+    """
+    if mode is None:
+        configs = CF_AUDIT_PRESETS
+    elif mode.lower() in ('ft', 'bo') and rounds and rounds.isdigit() and 1 <= int(rounds) <= 200:
+        configs = [(mode.lower() == 'ft', int(rounds))]
+    else:
+        return await ctx.reply('❌ Usage: `$cfaudit [ft|bo <rounds> [matches]]`\nExample: `$cfaudit ft 10 1000000`')
+    
+    if matches is not None and not matches.isdigit():
+        return await ctx.reply('❌ Number of matches must be a number!')
+    match_count = min(int(matches), CF_AUDIT_MAX_MATCHES) if matches else CF_AUDIT_MATCHES
+    if match_count < 1:
+        return await ctx.reply('❌ Number of matches must be at least 1!')
+    
+    msg = await ctx.reply(f'🎲 Simulating **{match_count:,}** matches per mode...')
+    
+    started = time.perf_counter()
+    results = [(is_first_to, total_rounds, await run_simulation(total_rounds, is_first_to, match_count)) for is_first_to, total_rounds in configs]
+    elapsed = time.perf_counter() - started
+    
+    embed = discord.Embed(
+        title='🪙 Coinflip Fairness Audit',
+        description=f'Simulated **{match_count:,}** matches per mode in {elapsed:.1f}s ({match_count * len(configs) / elapsed:,.0f} matches/s)\n'
+                    f'Anti-streak: {CF_STREAK_BREAK}% chance to break a streak of {CF_STREAK_LIMIT}+',
+        color=MM_COLOR
+    )
+    
+    for is_first_to, total_rounds, stats in results:
+        total_streaks = sum(stats.streaks.values())
+        shown = ' • '.join(
+            f'{length}: {stats.streaks.get(length, 0) / total_streaks:.1%}'
+            for length in range(1, CF_STREAK_LIMIT + 1)
+        )
+        longer = sum(count for length, count in stats.streaks.items() if length > CF_STREAK_LIMIT)
+        embed.add_field(
+            name=f'First to {total_rounds}' if is_first_to else f'Best of {total_rounds}',
+            value=f'Player 1 win rate: **{stats.user1_rate:.2%}**\n'
+                  f'Ties: {stats.ties / stats.matches:.2%}\n'
+                  f'Avg rounds: **{stats.expected_rounds:.2f}**\n'
+                  f'Streaks: {shown} • {CF_STREAK_LIMIT + 1}+: {longer / total_streaks:.1%}\n'
+                  f'Longest streak: {max(stats.streaks)}',
+            inline=True
+        )
+    
+    embed.timestamp = datetime.utcnow()
+    
+    await msg.edit(content=None, embed=embed)
+
+# Coinflip Status Command
+@bot.hybrid_command(name='cfstatus')
+@commands.has_permissions(administrator=True)
+@app_commands.default_permissions(administrator=True)
+async def cfstatus_command(ctx):
+    """Show live coinflip match counts"""
+    running = cf_matches.running
+    embed = discord.Embed(
+        title='🪙 Coinflip Matches',
+        description=f'**{cf_matches.active}** active ({running} running, {cf_matches.active - running} waiting for sides)\n'
+                    f'This server: **{cf_matches.guilds.get(ctx.guild.id, 0)}**/{CF_MAX_PER_GUILD}\n'
+                    f'This channel: **{len(cf_matches.channels.get(ctx.channel.id, ()))}**/{CF_MAX_PER_CHANNEL}\n'
+                    f'Busy channels: **{len(cf_matches.channels)}** across **{len(cf_matches.guilds)}** servers',
+        color=MM_COLOR
+    )
+    embed.timestamp = datetime.utcnow()
+    
+    await ctx.reply(embed=embed)
+
+# Ticket creation queue
+# Ticket creations go through a per-guild FIFO drained by at most TICKET_WORKERS
+# workers, so a burst on a panel waits in line instead of racing into the
+# channel-create rate limit.
+TICKET_WORKERS = 2        # ticket creations running at once per guild
+TICKET_QUEUE_LIMIT = 100  # tickets waiting per guild before new ones are refused
+ticket_queues = {}  # guild id -> TicketQueue
+
+class TicketQueue:
+    """FIFO of ticket creations for one guild with a bounded worker pool"""
+    def __init__(self, guild_id):
+        self.guild_id = guild_id
+        self.jobs = deque()  # (coroutine factory, future, kind, queued at)
+        self.workers = 0
+    
+    def submit(self, create, kind):
+        """Queue a creation, returns (future, place in line), place 0 means it starts right away"""
+        future = asyncio.get_running_loop().create_future()
+        self.jobs.append((create, future, kind, time.perf_counter()))
+        if self.workers < TICKET_WORKERS:
+            self.workers += 1
+            spawn(self.work(), 'Ticket queue')
+            return future, 0
+        return future, len(self.jobs)
+    
+    async def work(self):
+        try:
+            while self.jobs:
+                create, future, kind, queued_at = self.jobs.popleft()
+                TICKET_QUEUE_SECONDS.observe((kind, 'ok'), time.perf_counter() - queued_at)
+                if future.done():
+                    continue
+                try:
+                    result = await create()
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+                else:
+                    if not future.done():
+                        future.set_result(result)
+        finally:
+            self.workers -= 1
+            if not self.workers and not self.jobs:
+                ticket_queues.pop(self.guild_id, None)
+
+async def queue_ticket(interaction, create, kind):
+    """Run a ticket creation through the guild's queue, telling the user their place in line"""
+    queue = ticket_queues.get(interaction.guild.id)
+    if queue is None:
+        queue = ticket_queues[interaction.guild.id] = TicketQueue(interaction.guild.id)
+    if len(queue.jobs) >= TICKET_QUEUE_LIMIT:
+        raise RuntimeError('too many tickets are being opened right now, please try again in a minute')
+    
+    future, position = queue.submit(create, kind)
+    if position:
+        await interaction.followup.send(
+            f'⏳ Lots of tickets are being opened right now, you are **#{position}** in line. Your ticket will open shortly!',
+            ephemeral=True
+        )
+    return await future
 
 # Helper Functions
 async def create_ticket_with_details(guild, user, tier, trader, giving, receiving, both_join, tip):
     """Create MM ticket with tier-based permissions"""
+    started = time.perf_counter()
     try:
-        category = discord.utils.get(guild.categories, name=TICKET_CATEGORY)
-        if not category:
-            category = await guild.create_category(TICKET_CATEGORY)
-        
         # Base overwrites
         overwrites = {
             guild.default_role: discord.PermissionOverwrite(view_channel=False),
@@ -1196,111 +3432,115 @@ async def create_ticket_with_details(guild, user, tier, trader, giving, receivin
         }
         
         # Add ONLY the roles that can see this tier
-        ticket_level = MM_TIERS[tier]['level']
-        
-        for tier_key, role_id in MM_ROLE_IDS.items():
-            role = guild.get_role(role_id)
-            if role:
-                tier_level = MM_TIERS[tier_key]['level']
-                # OG sees everything, others only see their level or below
-                if tier_key == 'og' or tier_level >= ticket_level:
-                    overwrites[role] = discord.PermissionOverwrite(
-                        view_channel=True,
-                        send_messages=True,
-                        read_message_history=True,
-                        manage_messages=True
-                    )
-        
-        ticket_channel = await guild.create_text_channel(
-            name=f'ticket-{user.name}-mm',
-            category=category,
-            overwrites=overwrites
-        )
-        
-        active_tickets[ticket_channel.id] = {
-            'user_id': user.id,
-            'created_at': datetime.utcnow().isoformat(),
-            'tier': tier,
-            'trader': trader,
-            'giving': giving,
-            'receiving': receiving,
-            'both_join': both_join,
-            'tip': tip
-        }
-        
-        # GHOST PING: Ping tier role and user, then delete
-        tier_role_id = MM_ROLE_IDS.get(tier)
-        tier_role = guild.get_role(tier_role_id) if tier_role_id else None
-        
-        if tier_role:
-            ping_msg = await ticket_channel.send(f"{tier_role.mention} {user.mention}")
-            await ping_msg.delete()
-        
-        # Combined embed
-        embed = discord.Embed(
-            title=f"{MM_TIERS[tier]['emoji']} {MM_TIERS[tier]['name']}",
-            description=f"Welcome {user.mention}!\n\nOur team will be with you shortly. Please wait for a middleman to claim this ticket.",
-            color=MM_COLOR
-        )
-        
-        embed.add_field(
-            name="📊 Trade Details",
-            value=f"**Range:** {MM_TIERS[tier]['range']}\n**Status:** 🟡 Waiting for Middleman",
-            inline=False
-        )
-        
-        embed.add_field(
-            name="👥 Trading With",
-            value=trader,
-            inline=False
-        )
-        
-        embed.add_field(
-            name="📤 You're Giving",
-            value=giving,
-            inline=True
-        )
-        
-        embed.add_field(
-            name="📥 You're Receiving",
-            value=receiving,
-            inline=True
-        )
-        
-        embed.add_field(
-            name="🔗 Both Can Join Links?",
-            value=both_join,
-            inline=True
-        )
-        
-        embed.add_field(
-            name="💰 Tip",
-            value=tip if tip else "None",
-            inline=True
-        )
-        
-        embed.set_footer(
-            text=f'Ticket created by {user.name}',
-            icon_url=user.display_avatar.url
-        )
-        embed.timestamp = datetime.utcnow()
+        overwrites.update(tier_role_overwrites(guild, tier))
+        
+        name = f'ticket-{user.name}-mm'
+        ticket_channel = await open_pooled_channel(guild, tier, name, overwrites)
+        pooled = ticket_channel is not None
+        if not pooled:
+            category = await ensure_category(guild, guild_configs.get(guild.id).ticket_category)
+            with REST_SECONDS.time('create_text_channel'):
+                ticket_channel = await guild.create_text_channel(
+                    name=name,
+                    category=category,
+                    overwrites=overwrites
+                )
         
-        await ticket_channel.send(embed=embed, view=MMTicketView())
-        save_data()
+        record_mutation('open', guild_id=guild.id, channel_id=ticket_channel.id, ticket=Ticket(
+            user_id=user.id,
+            guild_id=guild.id,
+            created_at=int(time.time()),
+            tier=TIER_CODES[tier],
+            trader=trader,
+            giving=giving,
+            receiving=receiving,
+            both_join=both_join,
+            tip=tip
+        ))
+        
+        welcome = send_mm_ticket_welcome(ticket_channel, guild, user, tier, trader, giving, receiving, both_join, tip)
+        if pooled:
+            # The channel is already usable, don't keep the user waiting on the welcome messages
+            spawn(welcome, 'MM ticket welcome')
+        else:
+            await welcome
         
+        TICKETS_OPENED.inc('mm', 'pool' if pooled else 'created')
+        TICKET_OPEN_SECONDS.observe(('mm', 'ok'), time.perf_counter() - started)
     except Exception as e:
+        TICKET_OPEN_SECONDS.observe(('mm', 'error'), time.perf_counter() - started)
         print(f'[ERROR] MM Ticket creation failed: {e}')
         raise
 
+async def send_mm_ticket_welcome(ticket_channel, guild, user, tier, trader, giving, receiving, both_join, tip):
+    """Ghost ping the tier role and post the ticket embed"""
+    # GHOST PING: Ping tier role and user, then delete
+    tier_role = resolve_guild(guild).tier_roles.get(tier)
+    
+    if tier_role:
+        with REST_SECONDS.time('ghost_ping_send'):
+            ping_msg = await ticket_channel.send(f"{tier_role.mention} {user.mention}")
+        with REST_SECONDS.time('ghost_ping_delete'):
+            await ping_msg.delete()
+    
+    # Combined embed
+    embed = discord.Embed(
+        title=f"{MM_TIERS[tier]['emoji']} {MM_TIERS[tier]['name']}",
+        description=f"Welcome {user.mention}!\n\nOur team will be with you shortly. Please wait for a middleman to claim this ticket.",
+        color=MM_COLOR
+    )
+    
+    embed.add_field(
+        name="📊 Trade Details",
+        value=f"**Range:** {MM_TIERS[tier]['range']}\n**Status:** 🟡 Waiting for Middleman",
+        inline=False
+    )
+    
+    embed.add_field(
+        name="👥 Trading With",
+        value=trader,
+        inline=False
+    )
+    
+    embed.add_field(
+        name="📤 You're Giving",
+        value=giving,
+        inline=True
+    )
+    
+    embed.add_field(
+        name="📥 You're Receiving",
+        value=receiving,
+        inline=True
+    )
+    
+    embed.add_field(
+        name="🔗 Both Can Join Links?",
+        value=both_join,
+        inline=True
+    )
+    
+    embed.add_field(
+        name="💰 Tip",
+        value=tip if tip else "None",
+        inline=True
+    )
+    
+    embed.set_footer(
+        text=f'Ticket created by {user.name}',
+        icon_url=user.display_avatar.url
+    )
+    embed.timestamp = datetime.utcnow()
+    
+    with REST_SECONDS.time('welcome_send'):
+        await ticket_channel.send(embed=embed, view=MMTicketView())
+
 async def create_support_ticket(guild, user, reason, details):
     """Create a support ticket with staff ping and ghost ping"""
+    started = time.perf_counter()
     try:
-        category = discord.utils.get(guild.categories, name=SUPPORT_CATEGORY)
-        if not category:
-            category = await guild.create_category(SUPPORT_CATEGORY)
-        
         # Get staff role
-        staff_role = guild.get_role(STAFF_ROLE_ID)
+        staff_role = resolve_guild(guild).staff_role
         
         # Base overwrites
         overwrites = {
@@ -1327,61 +3567,276 @@ async def create_support_ticket(guild, user, reason, details):
                 manage_messages=True
             )
         
-        # Create ticket channel
-        ticket_channel = await guild.create_text_channel(
-            name=f'ticket-{user.name}-support',
-            category=category,
-            overwrites=overwrites
-        )
+        # Create ticket channel, or take one from the pool
+        name = f'ticket-{user.name}-support'
+        ticket_channel = await open_pooled_channel(guild, 'support', name, overwrites)
+        pooled = ticket_channel is not None
+        if not pooled:
+            category = await ensure_category(guild, guild_configs.get(guild.id).support_category)
+            with REST_SECONDS.time('create_text_channel'):
+                ticket_channel = await guild.create_text_channel(
+                    name=name,
+                    category=category,
+                    overwrites=overwrites
+                )
         
         # Store ticket data
-        active_tickets[ticket_channel.id] = {
-            'user_id': user.id,
-            'created_at': datetime.utcnow().isoformat(),
-            'type': 'support',
-            'reason': reason,
-            'details': details
-        }
+        record_mutation('open', guild_id=guild.id, channel_id=ticket_channel.id, ticket=Ticket(
+            user_id=user.id,
+            guild_id=guild.id,
+            created_at=int(time.time()),
+            type='support',
+            reason=reason,
+            details=details
+        ))
+        
+        welcome = send_support_ticket_welcome(ticket_channel, user, staff_role, reason, details)
+        if pooled:
+            spawn(welcome, 'Support ticket welcome')
+        else:
+            await welcome
         
-        # GHOST PING: Ping user and staff, then delete it
-        if staff_role:
+        TICKETS_OPENED.inc('support', 'pool' if pooled else 'created')
+        TICKET_OPEN_SECONDS.observe(('support', 'ok'), time.perf_counter() - started)
+    except Exception as e:
+        TICKET_OPEN_SECONDS.observe(('support', 'error'), time.perf_counter() - started)
+        print(f'[ERROR] Support Ticket creation failed: {e}')
+        raise
+
+async def send_support_ticket_welcome(ticket_channel, user, staff_role, reason, details):
+    """Ghost ping staff and post the support ticket embed"""
+    # GHOST PING: Ping user and staff, then delete it
+    if staff_role:
+        with REST_SECONDS.time('ghost_ping_send'):
             ping_msg = await ticket_channel.send(f"{staff_role.mention} {user.mention}")
+        with REST_SECONDS.time('ghost_ping_delete'):
             await ping_msg.delete()
-        
-        # Send ticket embed
-        embed = discord.Embed(
-            title='🎫 Support Ticket',
-            description=f"Welcome {user.mention}!\n\nOur staff team will be with you shortly.",
-            color=MM_COLOR
-        )
-        
-        embed.add_field(
-            name="📋 Reason",
-            value=reason,
-            inline=False
-        )
-        
-        embed.add_field(
-            name="📝 Details",
-            value=details,
-            inline=False
-        )
-        
-        embed.set_footer(
-            text=f'Ticket created by {user.name}',
-            icon_url=user.display_avatar.url
-        )
-        embed.timestamp = datetime.utcnow()
-        
+    
+    # Send ticket embed
+    embed = discord.Embed(
+        title='🎫 Support Ticket',
+        description=f"Welcome {user.mention}!\n\nOur staff team will be with you shortly.",
+        color=MM_COLOR
+    )
+    
+    embed.add_field(
+        name="📋 Reason",
+        value=reason,
+        inline=False
+    )
+    
+    embed.add_field(
+        name="📝 Details",
+        value=details,
+        inline=False
+    )
+    
+    embed.set_footer(
+        text=f'Ticket created by {user.name}',
+        icon_url=user.display_avatar.url
+    )
+    embed.timestamp = datetime.utcnow()
+    
+    with REST_SECONDS.time('welcome_send'):
         await ticket_channel.send(embed=embed, view=SupportTicketView())
-        save_data()
-        
-    except Exception as e:
-        print(f'[ERROR] Support Ticket creation failed: {e}')
+
+# Ticket transcripts
+# Closing a ticket first exports its history: messages are paged from the API
+# and streamed into a gzip JSONL file (plus an optional HTML render) on the
+# default executor, so a long ticket is never held in memory at once.
+# Attachments are stored once under their sha256. Other users' message content
+# needs the message content intent, so run with it when transcripts matter.
+TRANSCRIPT_DIR = 'transcripts'
+TRANSCRIPT_HTML = True
+TRANSCRIPT_BATCH = 100  # records handed to the writer at a time
+TRANSCRIPT_MAX_ATTACHMENT = 25 * 1024 * 1024  # larger files are only linked
+
+TRANSCRIPT_HTML_HEAD = '''<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{title}</title>
+<style>
+body {{ background: #313338; color: #dbdee1; font-family: Arial, sans-serif; margin: 24px; }}
+.msg {{ padding: 6px 0; border-bottom: 1px solid #3f4147; }}
+.author {{ font-weight: bold; color: #f2f3f5; }}
+.time {{ color: #949ba4; font-size: 12px; margin-left: 6px; }}
+.content {{ white-space: pre-wrap; margin-top: 2px; }}
+.embed {{ border-left: 4px solid #fee75c; background: #2b2d31; padding: 6px 10px; margin-top: 4px; white-space: pre-wrap; }}
+img {{ max-width: 400px; display: block; margin-top: 4px; }}
+a {{ color: #00a8fc; }}
+</style></head><body><h1>{title}</h1>
+'''
+TRANSCRIPT_HTML_FOOT = '</body></html>\n'
+
+def attachment_path(digest):
+    return os.path.join(TRANSCRIPT_DIR, 'attachments', digest[:2], digest)
+
+def store_attachment(data):
+    """Write attachment bytes under their sha256 unless already stored, returns the hash"""
+    digest = hashlib.sha256(data).hexdigest()
+    path = attachment_path(digest)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Unique per writer, two threads can store the same attachment at once
+        tmp_file = f'{path}.{os.getpid()}.{secrets.token_hex(4)}.tmp'
+        with open(tmp_file, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_file, path)
+    return digest
+
+def render_message_html(record):
+    """One transcript record as an HTML block"""
+    parts = [
+        f'<div class="msg"><span class="author">{html.escape(record["author"])}</span>'
+        f'<span class="time">{record["created_at"][:19].replace("T", " ")} UTC</span>'
+    ]
+    if record['content']:
+        parts.append(f'<div class="content">{html.escape(record["content"])}</div>')
+    for embed in record['embeds']:
+        text = '\n'.join(filter(None, [embed.get('title'), embed.get('description')] +
+                                [f'{field["name"]}: {field["value"]}' for field in embed.get('fields', ())]))
+        if text:
+            parts.append(f'<div class="embed">{html.escape(text)}</div>')
+    for attachment in record['attachments']:
+        name = html.escape(attachment['filename'])
+        # Transcripts live in TRANSCRIPT_DIR/<guild id>/, attachments next to them
+        href = f'../attachments/{attachment["sha256"][:2]}/{attachment["sha256"]}' if attachment.get('sha256') else html.escape(attachment['url'])
+        if (attachment['content_type'] or '').startswith('image/'):
+            parts.append(f'<a href="{href}" download="{name}"><img src="{href}" alt="{name}"></a>')
+        else:
+            parts.append(f'<a href="{href}" download="{name}">📎 {name}</a>')
+    parts.append('</div>\n')
+    return ''.join(parts)
+
+class TranscriptWriter:
+    """Gzip JSONL and optional HTML transcript, only moved into place by commit()"""
+    def __init__(self, base, title, with_html):
+        os.makedirs(os.path.dirname(base), exist_ok=True)
+        self.paths = [base + '.jsonl.gz'] + ([base + '.html'] if with_html else [])
+        # Unique per writer, so a stray second export can never share our files
+        suffix = f'.{os.getpid()}.{secrets.token_hex(4)}.tmp'
+        self.tmp_paths = [path + suffix for path in self.paths]
+        self.raw = open(self.tmp_paths[0], 'wb')
+        self.jsonl = gzip.GzipFile(fileobj=self.raw, mode='wb')
+        self.html = open(self.tmp_paths[1], 'w', encoding='utf-8') if with_html else None
+        if self.html:
+            self.html.write(TRANSCRIPT_HTML_HEAD.format(title=html.escape(title)))
+    
+    def write(self, records):
+        self.jsonl.write(''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records).encode())
+        if self.html:
+            self.html.write(''.join(render_message_html(record) for record in records))
+    
+    def commit(self):
+        """Finish both files, fsync them and rename them to their final names"""
+        self.jsonl.close()
+        outputs = [self.raw]
+        if self.html:
+            self.html.write(TRANSCRIPT_HTML_FOOT)
+            outputs.append(self.html)
+        for f, tmp_path, path in zip(outputs, self.tmp_paths, self.paths):
+            f.flush()
+            os.fsync(f.fileno())
+            f.close()
+            os.replace(tmp_path, path)
+    
+    def abort(self):
+        self.jsonl.close()
+        for f, tmp_path in zip([self.raw, self.html], self.tmp_paths):
+            if f is not None:
+                f.close()
+                try:
+                    os.remove(tmp_path)
+                except FileNotFoundError:
+                    pass
+
+async def transcript_record(message):
+    """JSON-ready record of a message, saving its attachments on the way"""
+    loop = asyncio.get_running_loop()
+    attachments = []
+    for attachment in message.attachments:
+        entry = {'filename': attachment.filename, 'size': attachment.size,
+                 'content_type': attachment.content_type, 'url': attachment.url}
+        if attachment.size <= TRANSCRIPT_MAX_ATTACHMENT:
+            try:
+                data = await attachment.read()
+                entry['sha256'] = await loop.run_in_executor(None, store_attachment, data)
+            except discord.HTTPException as e:
+                print(f'[ERROR] Could not save attachment {attachment.filename}: {e}')
+        attachments.append(entry)
+    return {
+        'id': message.id,
+        'author_id': message.author.id,
+        'author': str(message.author),
+        'created_at': message.created_at.isoformat(),
+        'edited_at': message.edited_at.isoformat() if message.edited_at else None,
+        'content': message.content,
+        'embeds': [embed.to_dict() for embed in message.embeds],
+        'attachments': attachments,
+        'reply_to': message.reference.message_id if message.reference else None,
+    }
+
+async def export_transcript(channel):
+    """Stream a channel's history to disk, returns (committed paths, message count)"""
+    loop = asyncio.get_running_loop()
+    base = os.path.join(TRANSCRIPT_DIR, str(channel.guild.id), f'{channel.name}-{channel.id}')
+    writer = await loop.run_in_executor(None, TranscriptWriter, base, f'#{channel.name}', TRANSCRIPT_HTML)
+    count = 0
+    batch = []
+    pending = None  # the previous batch is written while the next one is fetched
+    try:
+        with TRANSCRIPT_SECONDS.time():
+            async for message in channel.history(limit=None, oldest_first=True):
+                batch.append(await transcript_record(message))
+                if len(batch) >= TRANSCRIPT_BATCH:
+                    if pending is not None:
+                        await pending
+                    pending = loop.run_in_executor(None, writer.write, batch)
+                    count += len(batch)
+                    batch = []
+            if pending is not None:
+                await pending
+            await loop.run_in_executor(None, writer.write, batch)
+            count += len(batch)
+            await loop.run_in_executor(None, writer.commit)
+    except BaseException:
+        if pending is not None and not pending.done():
+            await asyncio.wait([pending])
+        writer.abort()
         raise
+    return writer.paths, count
+
+async def post_transcript(channel, user, paths, count):
+    """Send the committed transcript to the guild's transcript channel, if one is set"""
+    channel_id = guild_configs.get(channel.guild.id).transcript_channel_id
+    log_channel = channel.guild.get_channel(channel_id) if channel_id else None
+    if log_channel is None:
+        return
+    
+    embed = discord.Embed(
+        title='📜 Ticket Transcript',
+        description=f'**#{channel.name}** closed by {user.mention}\n**{count}** messages',
+        color=MM_COLOR
+    )
+    embed.timestamp = datetime.utcnow()
+    
+    uploads = [path for path in paths if os.path.getsize(path) <= channel.guild.filesize_limit]
+    if len(uploads) < len(paths):
+        embed.set_footer(text='Some files were too large to upload and are kept on the bot host')
+    await log_channel.send(embed=embed, files=[discord.File(path) for path in uploads])
+
+_closing_channels = set()  # channel ids with a close in flight
 
 async def close_ticket(channel, user):
     """Close ticket"""
+    # A double click or the button plus $close must not export twice
+    if channel.id in _closing_channels or channel.id in pending_deletions:
+        return
+    _closing_channels.add(channel.id)
+    try:
+        await close_and_export(channel, user)
+    finally:
+        _closing_channels.discard(channel.id)
+
+async def close_and_export(channel, user):
     embed = discord.Embed(
         title='🔒 Ticket Closed',
         description=f'Ticket closed by {user.mention}',
@@ -1391,20 +3846,208 @@ async def close_ticket(channel, user):
 
     await channel.send(embed=embed)
 
-    if channel.id in active_tickets:
-        del active_tickets[channel.id]
-    if channel.id in claimed_tickets:
-        del claimed_tickets[channel.id]
+    # The channel is only queued for deletion once its transcript is safely on disk
+    try:
+        paths, count = await export_transcript(channel)
+    except Exception as e:
+        print(f'[ERROR] Transcript export failed for #{channel.name}: {e}')
+        return await channel.send('⚠️ Could not save the transcript, so this channel was kept. Close it again to retry.')
     
-    save_data()
-
-    await asyncio.sleep(5)
-    await channel.delete()
+    # Both records land in the same flush, a restart can't orphan the channel
+    if channel.id in active_tickets or channel.id in claimed_tickets:
+        record_mutation('close', guild_id=channel.guild.id, channel_id=channel.id)
+    schedule_deletion(channel)
+    
+    try:
+        await post_transcript(channel, user, paths, count)
+    except Exception as e:
+        print(f'[ERROR] Could not post transcript for #{channel.name}: {e}')
+
+# Channel deletion queue
+# Closed tickets are queued as delete_queued records in the state model and a
+# single worker deletes them one at a time, retrying failures with backoff.
+# Pending deletions are persisted like tickets, so a restart resumes them.
+CHANNEL_DELETE_DELAY = 5        # seconds a closed ticket stays visible
+CHANNEL_DELETE_INTERVAL = 1.0   # minimum seconds between two deletes
+CHANNEL_DELETE_RETRY = 30       # first retry delay, doubled on every failure
+CHANNEL_DELETE_MAX_RETRY = 3600
+
+_deletions_changed = asyncio.Event()
+_deletion_attempts = {}  # channel id -> failed attempts, not persisted
+
+def schedule_deletion(channel, delay=CHANNEL_DELETE_DELAY):
+    """Queue a channel for the deletion worker"""
+    record_mutation('delete_queued', guild_id=channel.guild.id, channel_id=channel.id, due_at=int(time.time()) + delay)
+    _deletions_changed.set()
+
+async def delete_queued_channel(channel_id, deletion):
+    """Delete one queued channel, rescheduling it with backoff on transient errors"""
+    try:
+        channel = bot.get_channel(channel_id) or await bot.fetch_channel(channel_id)
+        with REST_SECONDS.time('channel_delete'):
+            await channel.delete()
+    except discord.NotFound:
+        pass
+    except discord.Forbidden:
+        print(f'[ERROR] Missing permissions to delete channel {channel_id}, dropping it from the queue')
+    except Exception as e:
+        attempts = _deletion_attempts[channel_id] = _deletion_attempts.get(channel_id, 0) + 1
+        retry = min(CHANNEL_DELETE_RETRY * 2 ** (attempts - 1), CHANNEL_DELETE_MAX_RETRY)
+        print(f'[ERROR] Deleting channel {channel_id} failed (attempt {attempts}), retrying in {retry}s: {e}')
+        if channel_id in pending_deletions:
+            pending_deletions[channel_id] = Deletion(deletion.guild_id, int(time.time()) + retry)
+        return
+    
+    _deletion_attempts.pop(channel_id, None)
+    # The channel delete event may already have dequeued it
+    if channel_id in pending_deletions:
+        record_mutation('deleted', guild_id=deletion.guild_id, channel_id=channel_id)
+    if TICKET_POOL_SIZE:
+        _pool_refill.set()
+
+async def deletion_loop():
+    """Drain the deletion queue in due order, one channel per CHANNEL_DELETE_INTERVAL"""
+    await bot.wait_until_ready()
+    if pending_deletions:
+        print(f'🗑️ Resuming {len(pending_deletions)} pending channel deletions')
+    while True:
+        _deletions_changed.clear()
+        if not pending_deletions:
+            await _deletions_changed.wait()
+            continue
+        
+        channel_id, deletion = min(pending_deletions.items(), key=lambda item: item[1].due_at)
+        wait = deletion.due_at - time.time()
+        if wait > 0:
+            try:
+                await asyncio.wait_for(_deletions_changed.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        
+        await delete_queued_channel(channel_id, deletion)
+        await asyncio.sleep(CHANNEL_DELETE_INTERVAL)
+
+_category_creations = {}  # (guild id, name) -> task creating that category
+
+async def ensure_category(guild, name):
+    """Find a category by name, creating it if missing (once, however many callers race)"""
+    resolved = resolve_guild(guild)
+    category = resolved.categories.get(name)
+    if category is None:
+        category = discord.utils.get(guild.categories, name=name)
+        if not category:
+            key = (guild.id, name)
+            task = _category_creations.get(key)
+            if task is None:
+                task = _category_creations[key] = asyncio.create_task(create_category(guild, name))
+                task.add_done_callback(lambda _: _category_creations.pop(key, None))
+            # Shielded so one caller giving up doesn't cancel the creation for the rest
+            category = await asyncio.shield(task)
+        resolved.categories[name] = category
+    return category
+
+async def create_category(guild, name):
+    with REST_SECONDS.time('create_category'):
+        return await guild.create_category(name)
+
+def spawn(coro, label):
+    """Run a coroutine in the background, logging instead of losing its errors"""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    
+    def done(task):
+        _background_tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            print(f'[ERROR] {label} failed: {task.exception()}')
+    
+    task.add_done_callback(done)
+    return task
+
+# Ticket Channel Pool
+# Hidden channels are created ahead of time per tier (and for support) so that
+# opening a ticket is a single rename + overwrites edit.
+TICKET_POOL_SIZE = 0          # channels kept ready per tier and for support, 0 disables
+TICKET_POOL_PREFIX = 'pool-'
+TICKET_POOL_REFILL = 60       # seconds between background top-ups
+POOL_KINDS = list(MM_TIERS) + ['support']
+
+ticket_pools = {}  # (guild id, kind) -> [channel id, ...]
+_pool_refill = asyncio.Event()
+_background_tasks = set()
+
+async def open_pooled_channel(guild, kind, name, overwrites):
+    """Turn a pooled channel into a ticket with one edit, None if the pool is empty"""
+    pool = ticket_pools.get((guild.id, kind))
+    while pool:
+        channel = guild.get_channel(pool.pop())
+        if channel is None:
+            continue
+        try:
+            with REST_SECONDS.time('pool_channel_edit'):
+                await channel.edit(name=name, overwrites=overwrites)
+        except discord.NotFound:
+            continue
+        except discord.HTTPException as e:
+            if e.status >= 500:
+                # Discord-side failure, keep the channel and let the caller create one
+                pool.append(channel.id)
+                print(f'[ERROR] Could not open pooled channel {channel.id}: {e}')
+                return None
+            # This channel can't be edited, drop it and try the next one
+            print(f'[ERROR] Dropping pooled channel {channel.id}: {e}')
+            spawn(channel.delete(), 'Pooled channel cleanup')
+            _pool_refill.set()
+            continue
+        _pool_refill.set()
+        return channel
+    return None
+
+async def top_up_ticket_pools(guild):
+    """Create hidden channels until every pool of the guild is full"""
+    for kind in POOL_KINDS:
+        config = guild_configs.get(guild.id)
+        category = await ensure_category(guild, config.support_category if kind == 'support' else config.ticket_category)
+        pool_name = f'{TICKET_POOL_PREFIX}{kind}'
+        pool = ticket_pools.get((guild.id, kind))
+        if pool is None:
+            # First pass for this guild, adopt pool channels left by a previous run
+            pool = ticket_pools[(guild.id, kind)] = [c.id for c in category.text_channels if c.name == pool_name]
+        
+        while len(pool) < TICKET_POOL_SIZE:
+            channel = await guild.create_text_channel(
+                name=pool_name,
+                category=category,
+                overwrites={
+                    guild.default_role: discord.PermissionOverwrite(view_channel=False),
+                    guild.me: discord.PermissionOverwrite(
+                        view_channel=True,
+                        send_messages=True,
+                        manage_channels=True,
+                        manage_messages=True
+                    )
+                }
+            )
+            pool.append(channel.id)
+
+async def ticket_pool_loop():
+    """Keep the channel pools topped up, waking early whenever a channel is used"""
+    await bot.wait_until_ready()
+    while True:
+        _pool_refill.clear()
+        for guild in bot.guilds:
+            try:
+                await top_up_ticket_pools(guild)
+            except Exception as e:
+                print(f'[ERROR] Ticket pool refill failed for {guild.name}: {e}')
+        try:
+            await asyncio.wait_for(_pool_refill.wait(), timeout=TICKET_POOL_REFILL)
+        except asyncio.TimeoutError:
+            pass
 
         
 # Run Bot
 if __name__ == '__main__':
-    keep_alive()
     TOKEN = os.getenv('TOKEN')
     if not TOKEN:
         print('❌ ERROR: No TOKEN found in environment variables!')
@@ -0,0 +1,84 @@
+"""Member cache cost of one large guild with MEMBER_CACHE=full vs lazy
+
+Run from the repo root: python tests/bench_member_cache.py [members]
+Each mode runs in its own process since bot reads MEMBER_CACHE on import.
+"""
+import asyncio
+import gc
+import os
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GUILD_ID = 1234567890123
+CHUNK_SIZE = 1000  # members per GUILD_MEMBERS_CHUNK, as the gateway sends them
+
+
+def guild_payload(n):
+    everyone = {'id': str(GUILD_ID), 'name': '@everyone', 'permissions': '0', 'position': 0, 'color': 0,
+                'hoist': False, 'managed': False, 'mentionable': False}
+    return {'id': str(GUILD_ID), 'name': 'big', 'member_count': n, 'roles': [everyone], 'channels': [],
+            'members': [], 'emojis': [], 'features': [], 'owner_id': '1', 'large': True}
+
+
+def member_payload(i):
+    return {'user': {'id': str(10**17 + i), 'username': f'user{i}', 'discriminator': '0', 'avatar': None,
+                     'global_name': f'User {i}'},
+            'nick': f'nick{i}' if i % 3 == 0 else None, 'roles': [], 'joined_at': '2024-01-01T00:00:00+00:00',
+            'deaf': False, 'mute': False, 'flags': 0}
+
+
+def run(mode, n):
+    os.environ['MEMBER_CACHE'] = mode
+    sys.path.insert(0, ROOT)
+    import discord
+    from discord.state import ChunkRequest
+
+    import bot
+
+    client = discord.Client(intents=bot.intents, **bot.member_options)
+    state = client._connection
+    state.user = None
+    chunks = [] if bot.LAZY_MEMBERS else [
+        [member_payload(i) for i in range(start, min(start + CHUNK_SIZE, n))] for start in range(0, n, CHUNK_SIZE)
+    ]
+
+    async def load():
+        guild = state._add_guild_from_data(guild_payload(n))
+        started = time.perf_counter()
+        if not bot.LAZY_MEMBERS:
+            # What chunk_guilds_at_startup delivers before on_ready
+            request = ChunkRequest(GUILD_ID, 0, asyncio.get_running_loop(), state._get_guild, cache=True)
+            state._chunk_requests[request.nonce] = request
+            for index, chunk in enumerate(chunks):
+                state.parse_guild_members_chunk({'guild_id': str(GUILD_ID), 'members': chunk, 'chunk_index': index,
+                                                 'chunk_count': len(chunks), 'nonce': request.nonce})
+        return guild, time.perf_counter() - started
+
+    tracemalloc.start()
+    guild, elapsed = asyncio.run(load())
+    chunk_count = len(chunks)
+    del chunks
+    gc.collect()
+    heap = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f'  {mode:4}: {len(guild.members):7} cached members  {chunk_count:4} chunks  '
+          f'parse {elapsed * 1000:6.0f} ms under tracemalloc  heap {heap / 2**20:6.1f} MiB  max RSS {rss:5.0f} MiB')
+
+
+def main():
+    if len(sys.argv) > 2:
+        run(sys.argv[2], int(sys.argv[1]))
+        return
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    print(f'{n} members in one guild')
+    for mode in ('full', 'lazy'):
+        subprocess.run([sys.executable, os.path.abspath(__file__), str(n), mode], check=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Retained memory of open tickets as legacy dicts vs Ticket records
+
+Run from the repo root: python tests/bench_ticket_memory.py [tickets]
+"""
+import gc
+import json
+import os
+import random
+import sys
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot
+
+WORDS = ['Dragon', 'Headless Horseman', 'Raccoon', 'Kitsune', 'Queen Bee', 'Disco Bee', 'Butterfly', '2x Mega']
+
+
+def legacy_payload(n, seed=0):
+    """Schema 0 tickets as bot_data.json held them: str channel ids, tier keys, ISO times"""
+    rng = random.Random(seed)
+    start = datetime(2026, 1, 1)
+    tickets = {}
+    for _ in range(n):
+        channel_id = rng.randrange(1 << 60, 1 << 62)
+        created_at = (start + timedelta(seconds=rng.randrange(0, 30_000_000))).isoformat()
+        if rng.random() < 0.2:
+            tickets[str(channel_id)] = {
+                'user_id': rng.randrange(1 << 60, 1 << 62),
+                'created_at': created_at,
+                'type': 'support',
+                'reason': rng.choice(WORDS),
+                'details': ' '.join(rng.choices(WORDS, k=4)),
+            }
+        else:
+            tickets[str(channel_id)] = {
+                'user_id': rng.randrange(1 << 60, 1 << 62),
+                'created_at': created_at,
+                'tier': rng.choice(list(bot.MM_TIERS)),
+                'trader': f'trader{rng.randrange(100_000)}',
+                'giving': rng.choice(WORDS),
+                'receiving': rng.choice(WORDS),
+                'both_join': rng.choice(['Yes', 'No']),
+                'tip': rng.choice(['Yes', 'No']),
+            }
+    return json.dumps(tickets)
+
+
+def retained(build, raw):
+    """Bytes still allocated after build(raw) returns, with the result kept alive"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build(raw)
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def as_dicts(raw):
+    return {int(channel_id): ticket for channel_id, ticket in json.loads(raw).items()}
+
+
+def as_tickets(raw):
+    return {int(channel_id): bot.Ticket.from_dict(ticket) for channel_id, ticket in json.loads(raw).items()}
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    raw = legacy_payload(n)
+    dicts = retained(as_dicts, raw)
+    tickets = retained(as_tickets, raw)
+    print(f'{n} tickets, including the channel id dict')
+    print(f'  dict:   {dicts / 2**20:7.2f} MiB  {dicts / n:6.0f} B/ticket')
+    print(f'  Ticket: {tickets / 2**20:7.2f} MiB  {tickets / n:6.0f} B/ticket')
+    print(f'  saved:  {1 - tickets / dicts:7.1%}')
+
+
+if __name__ == '__main__':
+    main()
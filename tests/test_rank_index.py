@@ -0,0 +1,60 @@
+import json
+
+import pytest
+
+import bot
+
+
+@pytest.fixture(autouse=True)
+def clear_state():
+    for table in (bot.active_tickets, bot.claimed_tickets, bot.pending_deletions, bot.mm_stats, bot.guild_mm_stats):
+        table.clear()
+    bot.mm_rank_index.keys = []
+    yield
+    for table in (bot.active_tickets, bot.claimed_tickets, bot.pending_deletions, bot.mm_stats, bot.guild_mm_stats):
+        table.clear()
+    bot.mm_rank_index.keys = []
+
+
+def test_update_moves_existing_key():
+    index = bot.MMRankIndex()
+    index.rebuild({'1': 5, '2': 3})
+    index.update(2, 3, 6)
+    assert index.page(10) == [(2, 6), (1, 5)]
+
+
+def test_update_with_missing_old_key_leaves_other_entries():
+    index = bot.MMRankIndex()
+    index.rebuild({'1': 5, '2': 3})
+    index.update(3, 4, 5)
+    assert index.page(10) == [(1, 5), (3, 5), (2, 3)]
+    assert index.rank(5) == 1
+    assert index.rank(3) == 3
+
+
+def test_update_on_empty_index():
+    index = bot.MMRankIndex()
+    index.update(1, 2, 3)
+    assert index.page(10) == [(1, 3)]
+
+
+def test_journal_replay_of_proof_for_snapshotted_mm(tmp_path):
+    data_file = tmp_path / 'bot_data.json'
+    journal_file = tmp_path / 'bot_data.journal'
+    store = bot.JournalStore(str(data_file), str(journal_file))
+    store.snapshot(1, {}, {}, {'111': 3, '222': 4}, {})
+    store.write([
+        {'seq': 2, 'op': 'proof', 'at': '2026-01-01T00:00:00', 'user_id': '111'},
+        {'seq': 3, 'op': 'proof', 'at': '2026-01-01T00:00:01', 'user_id': '111'},
+    ])
+    store._journal.close()
+
+    # Same order as load_data(): replay first, rebuild the index afterwards
+    seq, snapshot_seq = bot.JournalStore(str(data_file), str(journal_file)).load()
+    bot.mm_rank_index.rebuild(bot.mm_stats)
+
+    assert (seq, snapshot_seq) == (3, 1)
+    assert bot.mm_stats == {'111': 5, '222': 4}
+    assert bot.mm_rank_index.page(10) == [(111, 5), (222, 4)]
+    assert bot.mm_rank_index.rank(5) == 1
+    assert bot.mm_rank_index.rank(4) == 2
@@ -0,0 +1,126 @@
+import json
+import os
+import random
+import shutil
+
+import pytest
+
+import bot
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+TEXT = ['', 'Dragon', 'Headless Horseman', 'Ünïcødé 🐉', 'quote " and \\ slash', 'x' * 300]
+
+
+@pytest.fixture(autouse=True)
+def clear_state():
+    for table in (bot.active_tickets, bot.claimed_tickets, bot.pending_deletions, bot.mm_stats, bot.guild_mm_stats):
+        table.clear()
+    yield
+    for table in (bot.active_tickets, bot.claimed_tickets, bot.pending_deletions, bot.mm_stats, bot.guild_mm_stats):
+        table.clear()
+
+
+def snowflake(rng):
+    return rng.randrange(1 << 40, 1 << 63)
+
+
+def maybe_text(rng):
+    return rng.choice(TEXT + [None, None])
+
+
+def random_ticket(rng):
+    if rng.random() < 0.3:
+        return bot.Ticket(
+            user_id=snowflake(rng),
+            created_at=rng.randrange(0, 2_000_000_000),
+            type='support',
+            reason=maybe_text(rng),
+            details=maybe_text(rng),
+            guild_id=rng.choice([None, snowflake(rng)]),
+        )
+    return bot.Ticket(
+        user_id=snowflake(rng),
+        created_at=rng.randrange(0, 2_000_000_000),
+        tier=rng.choice(list(bot.TIER_KEYS)),
+        trader=maybe_text(rng),
+        giving=maybe_text(rng),
+        receiving=maybe_text(rng),
+        both_join=rng.choice(['Yes', 'No', None]),
+        tip=rng.choice(['Yes', 'No', None]),
+        guild_id=rng.choice([None, snowflake(rng)]),
+    )
+
+
+def random_state(rng):
+    tickets = {snowflake(rng): random_ticket(rng) for _ in range(rng.randrange(0, 40))}
+    claims = {channel_id: snowflake(rng) for channel_id in tickets if rng.random() < 0.4}
+    stats = {str(snowflake(rng)): rng.randrange(1, 10_000) for _ in range(rng.randrange(0, 20))}
+    deletions = {
+        snowflake(rng): bot.Deletion(snowflake(rng), rng.randrange(0, 2_000_000_000))
+        for _ in range(rng.randrange(0, 5))
+    }
+    return rng.randrange(0, 1 << 32), tickets, claims, stats, deletions
+
+
+@pytest.mark.parametrize('seed', range(200))
+def test_encode_decode_round_trip(seed):
+    state = random_state(random.Random(seed))
+    # Through real JSON text, which is where int keys used to turn into strings
+    decoded = bot.decode_state(json.loads(json.dumps(bot.encode_state(*state))))
+    assert decoded == state
+    seq, tickets, claims, stats, deletions = decoded
+    assert all(isinstance(channel_id, int) for channel_id in [*tickets, *claims, *deletions])
+
+
+def test_encoded_state_carries_schema_version():
+    assert bot.encode_state(0, {}, {}, {}, {})['schema'] == bot.SCHEMA_VERSION
+
+
+def test_newer_schema_is_refused():
+    with pytest.raises(ValueError):
+        bot.decode_state({'schema': bot.SCHEMA_VERSION + 1})
+
+
+def test_schema_0_file_migrates(tmp_path):
+    data_file = tmp_path / 'bot_data.json'
+    shutil.copy(os.path.join(FIXTURES, 'bot_data_v0.json'), data_file)
+    store = bot.JournalStore(str(data_file), str(tmp_path / 'bot_data.journal'))
+    
+    assert store.load() == (0, 0)
+    assert store.stale
+    
+    mm = bot.active_tickets[1458200000000000001]
+    assert mm.tier_key == 'premium'
+    assert mm.created_at == 1767621802
+    assert (mm.trader, mm.giving, mm.receiving, mm.both_join, mm.tip) == (
+        'Trader#0001', 'Mutated Dragon', '2x OG Garama', 'Yes', 'No'
+    )
+    support = bot.active_tickets[1458200000000000002]
+    assert (support.type, support.tier, support.reason, support.details) == ('support', 0, 'Claiming a Prize', None)
+    assert bot.claimed_tickets == {1458200000000000001: 801234567890123456}
+    assert bot.mm_stats == {'801234567890123456': 12, '801234567890123457': 3}
+    
+    # Rewriting the stale snapshot yields the current schema with the same state
+    store.snapshot(0, dict(bot.active_tickets), dict(bot.claimed_tickets), dict(bot.mm_stats), {})
+    store.close()
+    assert not store.stale
+    with open(data_file) as f:
+        rewritten = json.load(f)
+    assert rewritten['schema'] == bot.SCHEMA_VERSION
+    assert bot.decode_state(rewritten)[1:4] == (bot.active_tickets, bot.claimed_tickets, bot.mm_stats)
+
+
+def test_partition_snapshot_counts_tickets_without_guild(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(bot, 'DATA_DIR', str(tmp_path))
+    tickets = {
+        1: bot.Ticket(user_id=10, created_at=0, guild_id=100),
+        2: bot.Ticket(user_id=20, created_at=0),
+    }
+    partitions = bot.GuildPartitions()
+    partitions.snapshot(5, tickets, {1: 30, 2: 40}, {}, {})
+    partitions.close()
+    
+    assert '1 tickets with no guild id' in capsys.readouterr().out
+    assert set(partitions.stores) == {100}
+    with open(tmp_path / '100' / 'bot_data.json') as f:
+        assert bot.decode_state(json.load(f))[:3] == (5, {1: tickets[1]}, {1: 30})
@@ -0,0 +1,79 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import bot
+
+GUILD_ID = 1234
+
+
+@pytest.fixture(autouse=True)
+def clear_access_cache():
+    bot.member_access_cache.clear()
+    yield
+    bot.member_access_cache.clear()
+
+
+def make_member(*tiers, admin=False, member_id=1):
+    """Stub member holding the default MM role of each given tier"""
+    return SimpleNamespace(
+        id=member_id,
+        guild=SimpleNamespace(id=GUILD_ID),
+        roles=[SimpleNamespace(id=bot.MM_ROLE_IDS[tier]) for tier in tiers],
+        guild_permissions=SimpleNamespace(administrator=admin),
+    )
+
+
+@pytest.mark.parametrize('member_tier', list(bot.MM_TIERS))
+@pytest.mark.parametrize('ticket_tier', list(bot.MM_TIERS))
+def test_member_sees_tiers_at_or_below_their_level(member_tier, ticket_tier):
+    member = make_member(member_tier)
+    expected = bot.MM_TIERS[member_tier]['level'] >= bot.MM_TIERS[ticket_tier]['level']
+    assert bot.can_see_tier(member, ticket_tier) is expected
+
+
+@pytest.mark.parametrize('member_tier', list(bot.MM_TIERS))
+def test_every_mm_tier_counts_as_mm(member_tier):
+    member = make_member(member_tier)
+    assert bot.is_mm_or_admin(member, member.guild)
+
+
+def test_top_tier_sees_every_tier():
+    top = max(bot.MM_TIERS, key=lambda tier: bot.MM_TIERS[tier]['level'])
+    member = make_member(top)
+    assert all(bot.can_see_tier(member, tier) for tier in bot.MM_TIERS)
+
+
+def test_highest_role_wins():
+    member = make_member('basic', 'premium')
+    assert bot.can_see_tier(member, 'premium')
+    assert not bot.can_see_tier(member, 'og')
+
+
+def test_member_without_mm_roles():
+    member = make_member()
+    assert not bot.is_mm_or_admin(member, member.guild)
+    assert not any(bot.can_see_tier(member, tier) for tier in bot.MM_TIERS)
+
+
+def test_admin_without_mm_roles_sees_everything():
+    member = make_member(admin=True)
+    assert bot.is_mm_or_admin(member, member.guild)
+    assert all(bot.can_see_tier(member, tier) for tier in bot.MM_TIERS)
+
+
+def test_unknown_tier_is_admin_only():
+    assert not bot.can_see_tier(make_member('og'), None)
+    assert bot.can_see_tier(make_member(admin=True, member_id=2), None)
+
+
+def test_role_change_invalidates_cached_access():
+    before = make_member('basic')
+    assert not bot.can_see_tier(before, 'og')
+    
+    after = make_member('og')
+    # Still the cached level until the member update listener runs
+    assert not bot.can_see_tier(after, 'og')
+    asyncio.run(bot.access_member_update(before, after))
+    assert bot.can_see_tier(after, 'og')